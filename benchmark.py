@@ -0,0 +1,169 @@
+"""Headless ScriptEngine benchmarks against fake screen, OCR and input backends.
+
+Usage: python benchmark.py [--fixtures DIR] [--repeat N] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import types
+import numpy as np
+from macro_format import import_json
+
+FIXTURE_DIR = 'benchmark_fixtures'
+FIXTURE_WORDS = ['File', 'Edit', 'View', 'Settings', 'Login', 'Cancel', 'Status', 'Ready', 'Export', 'Report']
+
+class FakeScreen:
+    """Serves fixture frames in rotation as the 'screen' and records input calls instead of performing them."""
+    def __init__(self, frame_paths):
+        from PIL import Image
+        self.frames = [Image.open(p).convert('RGB') for p in frame_paths]; self.index = 0
+        self.captures = 0; self.inputs = 0
+
+    def screenshot(self, *args, region=None, **kwargs):
+        frame = self.frames[self.index % len(self.frames)]; self.index += 1; self.captures += 1
+        return frame.crop((region[0], region[1], region[0] + region[2], region[1] + region[3])) if region else frame
+
+    def shown(self): return (self.index - 1) % len(self.frames)  # the frame the last screenshot returned
+    def record_input(self, *args, **kwargs): self.inputs += 1
+
+    def as_pyautogui(self):
+        module = types.ModuleType('pyautogui')
+        module.screenshot = self.screenshot
+        for name in ('click', 'doubleClick', 'rightClick', 'moveTo', 'dragTo', 'scroll', 'press', 'write'): setattr(module, name, self.record_input)
+        module.position = lambda: (0, 0)
+        module.pixelMatchesColor = lambda *args, **kwargs: True
+        module.getWindowsWithTitle = lambda title: []
+        return module
+
+class FakeOcrBackend:
+    """Returns the recorded OCR words of the fixture frame the screen last served; optional latency stands in for Tesseract."""
+    name = 'fake'
+    def __init__(self, frame_paths, latency=0.0, screen=None):
+        self.latency = latency; self.screen = screen; self.calls = 0; self.data = []
+        for path in frame_paths:
+            ocr_path = os.path.splitext(path)[0] + '.ocr.json'
+            if os.path.exists(ocr_path):
+                with open(ocr_path, 'r') as f: self.data.append(json.load(f))
+            else: self.data.append({'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []})
+
+    def image_to_data(self, image):
+        self.calls += 1
+        if self.latency: time.sleep(self.latency)
+        return self.data[self.screen.shown() if self.screen else 0]
+
+    def image_to_string(self, image): return ' '.join(self.image_to_data(image)['text'])
+    def resize(self, workers): pass
+
+def install_fakes(screen):
+    """Put fake modules in place before script_engine is imported, so no display or Tesseract is needed."""
+    sys.modules['pyautogui'] = screen.as_pyautogui()
+    playsound = types.ModuleType('playsound'); playsound.playsound = lambda *args, **kwargs: None; sys.modules['playsound'] = playsound
+    if 'pytesseract' not in sys.modules:
+        try: import pytesseract  # noqa: F401 (only needed for its Output constants)
+        except ImportError:
+            fake = types.ModuleType('pytesseract'); fake.pytesseract = types.SimpleNamespace(tesseract_cmd='tesseract')
+            fake.Output = types.SimpleNamespace(DICT='dict', STRING='string'); sys.modules['pytesseract'] = fake
+
+def make_fixtures(directory, count=3, size=(1920, 1080)):
+    import cv2
+    os.makedirs(directory, exist_ok=True)
+    width, height = size; rng = np.random.default_rng(7)
+    button = np.zeros((40, 120, 3), np.uint8); cv2.rectangle(button, (2, 2), (117, 37), (40, 120, 230), -1)
+    cv2.putText(button, 'OK', (40, 29), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    cv2.imwrite(os.path.join(directory, 'template_button.png'), button)
+    for index in range(count):
+        frame = np.full((height, width, 3), 235, np.uint8); frame += rng.integers(0, 8, frame.shape, dtype=np.uint8)
+        ocr = {key: [] for key in ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num', 'left', 'top', 'width', 'height', 'conf', 'text')}
+        for row in range(20):
+            for col in range(8):
+                word = FIXTURE_WORDS[(row * 8 + col + index) % len(FIXTURE_WORDS)]; x, y = 40 + col * 230, 60 + row * 50
+                (w, h), _ = cv2.getTextSize(word, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+                cv2.putText(frame, word, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (20, 20, 20), 2)
+                for key, value in zip(ocr, (5, 1, 1, 1, row + 1, col + 1, x, y - h, w, h, 95, word)): ocr[key].append(value)
+        for y in (300, 600, 900): frame[y:y + 40, 1700:1820] = button
+        cv2.imwrite(os.path.join(directory, f'frame_{index:02d}.png'), frame)
+        with open(os.path.join(directory, f'frame_{index:02d}.ocr.json'), 'w') as f: json.dump(ocr, f)
+    macro = [{'type': 'click_location', 'x': 100 + i, 'y': 200} if i % 3 == 0 else {'type': 'key', 'key_name': 'tab'} if i % 3 == 1 else {'type': 'type', 'text': 'abc'} for i in range(300)]
+    with open(os.path.join(directory, 'macro.json'), 'w') as f: json.dump(macro, f)
+    import_json(os.path.join(directory, 'macro.json'), os.path.join(directory, 'macro.macro'))
+
+def benchmark_cases(fixtures):
+    template = os.path.join(fixtures, 'template_button.png').replace('\\', '/'); macro = os.path.join(fixtures, 'macro.json').replace('\\', '/')
+    interpreter = 'var i 0\nloop 2000\n  eval i = $i + 1\n  if_eval $i % 2 == 0\n    var even 1\n  else\n    var even 0\n  endif\nendloop\n'
+    nested = 'var total 0\nloop 50\n  loop 50\n    eval total = $total + 1\n  endloop\nendloop\n'
+    # (name, script, operations per run, reset OCR cache before each run)
+    binary_macro = os.path.join(fixtures, 'macro.macro').replace('\\', '/')
+    cases = [
+        ('interpreter', interpreter, 2000 * 4, False),
+        ('nested_loops', nested, 50 * 50 + 50, False),
+        ('ocr_lookup', 'if_text_screen "Report"\nendif\n', 1, True),
+        ('ocr_lookup_cached', 'if_text_screen "Report"\nendif\n', 1, False),
+        ('ocr_lookup_region', 'if_text_screen "Report" 0 0 960 540\nendif\n', 1, True),
+        ('image_match', f'if_image_screen "{template}"\nendif\n', 1, False),
+        ('image_find_all', f'find_all_images hits "{template}" 0.9\n', 1, False),
+        ('macro_playback', f'playback "{macro}"\n', 300, False),
+    ]
+    if os.path.exists(binary_macro): cases.append(('macro_playback_binary', f'playback "{binary_macro}"\n', 300, False))
+    return cases
+
+def percentiles(samples):
+    values = np.array(samples) * 1000.0
+    return {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)), 'p90': float(np.percentile(values, 90)), 'p99': float(np.percentile(values, 99)), 'max': float(values.max())}
+
+def run_benchmarks(fixtures, repeat=20, ocr_latency=0.0, only=None):
+    frame_paths = sorted(glob.glob(os.path.join(fixtures, 'frame_*.png')))
+    if not frame_paths: make_fixtures(fixtures); frame_paths = sorted(glob.glob(os.path.join(fixtures, 'frame_*.png')))
+    screen = FakeScreen(frame_paths); install_fakes(screen)
+    from script_engine import ScriptEngine
+    messages = []
+    engine = ScriptEngine(messages.append, lambda status: None, lambda message: None)
+    engine.ocr_backend = FakeOcrBackend(frame_paths, ocr_latency, screen); engine.frame_cache_age = 0.0  # every lookup pays for its own capture
+    results = {}
+    for name, script, ops, cold_ocr in benchmark_cases(fixtures):
+        if only and name not in only: continue
+        engine.run_script(script)  # warm-up: compiles the script and fills template caches
+        samples = []
+        for _ in range(repeat):
+            if cold_ocr: engine.ocr_cache.clear()
+            messages.clear(); start = time.perf_counter()
+            finished = engine.run_script(script)
+            samples.append(time.perf_counter() - start)
+            if not finished: raise RuntimeError(f"Benchmark '{name}' did not finish: {messages[-3:]}")
+        total = sum(samples)
+        results[name] = {'runs': repeat, 'ops_per_run': ops, 'ops_per_sec': ops * repeat / total if total else 0.0, 'latency_ms': percentiles(samples)}
+    return {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'platform': platform.platform(),
+                     'repeat': repeat, 'ocr_latency': ocr_latency, 'captures': screen.captures}, 'results': results}
+
+def print_report(report, previous=None):
+    print(f"{'benchmark':<20}{'ops/sec':>14}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}" + (f"{'vs prev':>10}" if previous else ''))
+    for name, result in report['results'].items():
+        latency = result['latency_ms']
+        line = f"{name:<20}{result['ops_per_sec']:>14.1f}{latency['p50']:>10.2f}{latency['p90']:>10.2f}{latency['p99']:>10.2f}"
+        before = (previous or {}).get('results', {}).get(name)
+        if before and before['ops_per_sec']: line += f"{(result['ops_per_sec'] / before['ops_per_sec'] - 1) * 100:>+9.1f}%"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ScriptEngine headlessly against fixture frames.")
+    parser.add_argument('--fixtures', default=FIXTURE_DIR, help="directory of frame_*.png fixtures (generated if empty)")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--ocr-latency', type=float, default=0.0, help="seconds the fake OCR backend sleeps per call")
+    parser.add_argument('--only', nargs='*', help="run only these benchmarks")
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--compare', help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+    report = run_benchmarks(args.fixtures, args.repeat, args.ocr_latency, args.only)
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as f: previous = json.load(f)
+    print_report(report, previous)
+    if args.output:
+        with open(args.output, 'w') as f: json.dump(report, f, indent=4)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import ast
+import operator
+import re
+from functools import lru_cache
+
+VAR_PREFIX = '__var_'
+# $name outside of string literals; quoted strings are matched first and interpolated when compiled instead
+VARIABLE_OR_STRING = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|\$(\w+)')
+VARIABLE_REF = re.compile(r'\$(\w+)')
+# text that is a valid Python number literal; "007" is not (leading zeros), so it stays text
+NUMBER = re.compile(r'\s*[-+]?(\d+\.\d*|\.\d+|\d+(?=[eE])|0+|[1-9]\d*)([eE][-+]?\d+)?\s*$')
+KEYWORD_VALUES = {'True': True, 'False': False, 'None': None}
+MAX_EXPONENT = 10000
+
+BINARY_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+              ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor, ast.RShift: operator.rshift}
+UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: operator.not_, ast.Invert: operator.invert}
+COMPARE_OPS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+               ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b}
+SAFE_FUNCTIONS = {'abs': abs, 'min': min, 'max': max, 'round': round, 'sum': sum, 'len': len, 'int': int, 'float': float, 'str': str, 'bool': bool,
+                  'lower': str.lower, 'upper': str.upper, 'strip': str.strip, 'replace': str.replace, 'startswith': str.startswith, 'endswith': str.endswith}
+
+class ExpressionError(Exception):
+    """Raised when an expression uses syntax or names outside the allowed subset."""
+    pass
+
+def _power(base, exponent):
+    if isinstance(exponent, (int, float)) and abs(exponent) > MAX_EXPONENT: raise ExpressionError(f"Exponent {exponent} is too large.")
+    return operator.pow(base, exponent)
+
+def _left_shift(value, bits):
+    if isinstance(bits, int) and bits > MAX_EXPONENT: raise ExpressionError(f"Shift {bits} is too large.")
+    return operator.lshift(value, bits)
+
+def _lookup(variables, name):
+    try: return variables[name]
+    except KeyError: raise KeyError(f"Variable '${name}' not found.") from None
+
+def _coerce(value):
+    """Values read from the screen or set with var are stored as text; read numbers, True, False and None as a literal would be."""
+    if not isinstance(value, str): return value
+    if NUMBER.match(value):
+        try: return int(value)
+        except ValueError: return float(value)
+    return KEYWORD_VALUES.get(value.strip(), value)
+
+def _variable(name):
+    return lambda variables: _coerce(_lookup(variables, name))
+
+def _interpolate(text):
+    """A string literal with $name references, substituted with each variable's text when evaluated."""
+    parts = VARIABLE_REF.split(text); literals, names = parts[0::2], parts[1::2]
+    def render(variables):
+        out = [literals[0]]
+        for name, literal in zip(names, literals[1:]): out.append(str(_lookup(variables, name))); out.append(literal)
+        return ''.join(out)
+    return render
+
+def _compile_node(node):
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, str) and VARIABLE_REF.search(value): return _interpolate(value)
+        return lambda variables: value
+    if isinstance(node, ast.Name):
+        if node.id.startswith(VAR_PREFIX): return _variable(node.id[len(VAR_PREFIX):])
+        raise ExpressionError(f"Unknown name '{node.id}' (variables need a $ prefix).")
+    if isinstance(node, ast.BinOp):
+        op = _power if isinstance(node.op, ast.Pow) else _left_shift if isinstance(node.op, ast.LShift) else BINARY_OPS.get(type(node.op))
+        if op is None: raise ExpressionError(f"Operator {type(node.op).__name__} is not allowed.")
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        return lambda variables: op(left(variables), right(variables))
+    if isinstance(node, ast.UnaryOp):
+        op = UNARY_OPS.get(type(node.op))
+        if op is None: raise ExpressionError(f"Operator {type(node.op).__name__} is not allowed.")
+        operand = _compile_node(node.operand); return lambda variables: op(operand(variables))
+    if isinstance(node, ast.BoolOp):
+        values = [_compile_node(v) for v in node.values]
+        if isinstance(node.op, ast.And):
+            def and_(variables):
+                result = True
+                for value in values:
+                    result = value(variables)
+                    if not result: return result
+                return result
+            return and_
+        def or_(variables):
+            result = False
+            for value in values:
+                result = value(variables)
+                if result: return result
+            return result
+        return or_
+    if isinstance(node, ast.Compare):
+        left = _compile_node(node.left); ops = []
+        for op_node, comparator in zip(node.ops, node.comparators):
+            op = COMPARE_OPS.get(type(op_node))
+            if op is None: raise ExpressionError(f"Comparison {type(op_node).__name__} is not allowed.")
+            ops.append((op, _compile_node(comparator)))
+        if len(ops) == 1:
+            (op, right), = ops; return lambda variables: op(left(variables), right(variables))
+        def chain(variables):
+            current = left(variables)
+            for op, right in ops:
+                following = right(variables)
+                if not op(current, following): return False
+                current = following
+            return True
+        return chain
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = _compile_node(node.test), _compile_node(node.body), _compile_node(node.orelse)
+        return lambda variables: body(variables) if test(variables) else orelse(variables)
+    if isinstance(node, (ast.List, ast.Tuple)):
+        items = [_compile_node(e) for e in node.elts]; container = list if isinstance(node, ast.List) else tuple
+        return lambda variables: container(item(variables) for item in items)
+    if isinstance(node, ast.Subscript):
+        value = _compile_node(node.value); index = _compile_node(node.slice)
+        return lambda variables: value(variables)[index(variables)]
+    if isinstance(node, ast.Slice):
+        parts = [_compile_node(p) if p is not None else (lambda variables: None) for p in (node.lower, node.upper, node.step)]
+        return lambda variables: slice(*(p(variables) for p in parts))
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in SAFE_FUNCTIONS or node.keywords:
+            raise ExpressionError(f"Call to '{ast.unparse(node.func)}' is not allowed.")
+        func = SAFE_FUNCTIONS[node.func.id]; args = [_compile_node(a) for a in node.args]
+        return lambda variables: func(*(arg(variables) for arg in args))
+    raise ExpressionError(f"Syntax '{type(node).__name__}' is not allowed.")
+
+def _rewrite_variables(expression):
+    return VARIABLE_OR_STRING.sub(lambda m: m.group(1) or f"{VAR_PREFIX}{m.group(2)}", expression)
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression):
+    """Compile an expression once into a closure that takes the variables dict and returns the value."""
+    try: tree = ast.parse(_rewrite_variables(expression.strip()), mode='eval')
+    except SyntaxError as e: raise ExpressionError(f"Invalid syntax: {e.msg}") from None
+    return _compile_node(tree.body)
+
+def evaluate(expression, variables):
+    return compile_expression(expression)(variables)
@@ -0,0 +1,112 @@
+"""Run scripts without the GUI, many at once across a process pool, with JSON-lines logs.
+
+Usage:
+  python headless_runner.py SCRIPT_OR_DIR [...] [--jobs N] [--frames DIR_OR_VIDEO [--each-frame]] [--log run.jsonl] [--var name=value] [--record DIR]
+  python headless_runner.py SCRIPT_OR_DIR [...] --check
+
+With --frames the screen is replayed from a video or a directory of images (see screen_backend.ReplayScreen) and input
+actions are logged instead of performed, so jobs can run in parallel; without it scripts drive the live desktop and run
+one at a time. --each-frame runs every script once per image, with $frame_path and $frame_name set, e.g. to OCR values
+out of a folder of saved screenshots. --record keeps each run's captured frames as DIR/<script>[_<frame>].nxrun (see
+run_recorder.py).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SCRIPT_EXTENSION = '.txt'
+
+def collect_scripts(paths):
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path): scripts += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(SCRIPT_EXTENSION))
+        else: scripts.append(path)
+    return scripts
+
+def json_safe(variables):
+    safe = {}
+    for name, value in variables.items():
+        try: json.dumps(value); safe[name] = value
+        except (TypeError, ValueError): safe[name] = repr(value)
+    return safe
+
+def run_job(job):
+    """Run one script in this process and return its result with every log record; also the process-pool entry point."""
+    from screen_backend import LiveScreen, ReplayScreen, open_recording
+    from script_engine import ScriptEngine
+    records = []; frame = job.get('frame')
+    def log(kind, message): records.append({'ts': time.time(), 'pid': os.getpid(), 'script': job['script'], 'frame': frame, 'kind': kind, 'message': message})
+    started = time.perf_counter()
+    try:
+        with open(job['script'], 'r', encoding='utf-8') as f: script = f.read()
+        recording = frame or job.get('recording')
+        screen = ReplayScreen(open_recording(recording), on_input=lambda action: log('input', action)) if recording else LiveScreen()
+        engine = ScriptEngine(lambda message: log('output', message), lambda status: log('status', status), lambda message: log('popup', message), screen)
+        engine.variables.update(job.get('variables', {}))
+        if frame: engine.variables.update(frame_path=frame, frame_name=os.path.basename(frame))
+        if job.get('record_dir'):
+            name = os.path.splitext(os.path.basename(job['script']))[0] + (f"_{os.path.splitext(os.path.basename(frame))[0]}" if frame else '')
+            engine.record_path = os.path.join(job['record_dir'], name + '.nxrun')
+        ok = engine.run_script(script); variables = json_safe(engine.variables)
+    except Exception as e:  # a broken job is reported, not allowed to take the pool down
+        log('error', f"{type(e).__name__}: {e}"); ok = False; variables = {}
+    return {'script': job['script'], 'frame': frame, 'ok': ok, 'seconds': time.perf_counter() - started, 'variables': variables, 'records': records}
+
+def check_scripts(scripts, out):
+    from script_compiler import check_program, compile_script
+    from script_engine import ScriptEngine
+    failures = 0
+    for path in scripts:
+        with open(path, 'r', encoding='utf-8') as f: problems = check_program(compile_script(f.read(), ScriptEngine))
+        failures += bool(problems)
+        for line, message in problems: write_record(out, {'kind': 'problem', 'script': path, 'line': line, 'message': message})
+        write_record(out, {'kind': 'check', 'script': path, 'ok': not problems})
+    return failures
+
+def write_record(out, record): out.write(json.dumps(record) + '\n'); out.flush()
+
+def parse_variables(pairs):
+    variables = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition('=')
+        try: variables[name] = json.loads(value)
+        except ValueError: variables[name] = value
+    return variables
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Nexus automation scripts headlessly.")
+    parser.add_argument('paths', nargs='+', help="script files or directories of .txt scripts")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="worker processes for replay runs")
+    parser.add_argument('--frames', help="video or directory of screen images to replay instead of the live desktop")
+    parser.add_argument('--each-frame', action='store_true', help="run each script once per frame image")
+    parser.add_argument('--var', action='append', help="preset a variable, name=value (value parsed as JSON when possible)")
+    parser.add_argument('--log', help="write JSON-lines records here instead of stdout")
+    parser.add_argument('--record', help="record the frames each run captures into .nxrun files in this directory")
+    parser.add_argument('--check', action='store_true', help="only compile the scripts and report problems")
+    args = parser.parse_args(argv)
+    scripts = collect_scripts(args.paths)
+    out = open(args.log, 'a', encoding='utf-8') if args.log else sys.stdout
+    try:
+        if args.check: return 1 if check_scripts(scripts, out) else 0
+        from screen_backend import list_frames
+        common = {'variables': parse_variables(args.var), 'record_dir': args.record}
+        if args.each_frame and args.frames: jobs = [dict(common, script=s, frame=f) for s in scripts for f in list_frames(args.frames)]
+        else: jobs = [dict(common, script=s, recording=args.frames) for s in scripts]
+        workers = max(1, min(args.jobs, len(jobs))) if args.frames else 1  # there is only one live desktop to drive
+        started = time.perf_counter(); failed = 0
+        if workers == 1: results = map(run_job, jobs)
+        else: pool = ProcessPoolExecutor(max_workers=workers); results = (future.result() for future in as_completed([pool.submit(run_job, job) for job in jobs]))
+        for result in results:
+            for record in result.pop('records'): write_record(out, record)
+            write_record(out, {'kind': 'result', **result}); failed += not result['ok']
+        if workers > 1: pool.shutdown()
+        print(f"{len(jobs)} runs, {len(jobs) - failed} finished, {failed} stopped or failed, {time.perf_counter() - started:.1f}s with {workers} worker(s)", file=sys.stderr)
+        return 1 if failed else 0
+    finally:
+        if out is not sys.stdout: out.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+PYRAMID_SCALE = 0.5  # first pass runs on a half-resolution copy of both images
+MIN_PYRAMID_SIDE = 12  # below this (after scaling) the template carries too little detail for a coarse pass
+COARSE_SLACK = 0.15  # coarse scores run lower than full-resolution ones; keep candidates within this margin
+MAX_CANDIDATES = 5
+
+def decode_image(path, flags=cv2.IMREAD_COLOR):
+    # imdecode instead of imread so non-ASCII Windows paths still load
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+    if image is None: raise ValueError(f"Could not decode image '{path}'")
+    return image
+
+def load_grayscale(path): return decode_image(path, cv2.IMREAD_GRAYSCALE)
+
+def to_gray(image):
+    if image.ndim == 2: return image
+    return cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+
+class Template:
+    __slots__ = ('path', 'gray', 'small')
+    def __init__(self, path, gray):
+        self.path = path; self.gray = gray
+        h, w = gray.shape
+        use_pyramid = min(h, w) * PYRAMID_SCALE >= MIN_PYRAMID_SIDE
+        self.small = cv2.resize(gray, (int(w * PYRAMID_SCALE), int(h * PYRAMID_SCALE)), interpolation=cv2.INTER_AREA) if use_pyramid else None
+
+class TemplateCache:
+    """Decoded grayscale templates keyed by path and mtime, so editing a PNG on disk is picked up."""
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries; self.entries = OrderedDict(); self.lock = threading.Lock()
+
+    def get(self, path):
+        abs_path = os.path.abspath(path); key = (abs_path, os.path.getmtime(abs_path))
+        with self.lock:
+            template = self.entries.get(key)
+            if template is not None: self.entries.move_to_end(key); return template
+        template = Template(abs_path, load_grayscale(abs_path))
+        with self.lock:
+            for stale in [k for k in self.entries if k[0] == abs_path]: del self.entries[stale]
+            self.entries[key] = template
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+        return template
+
+class ImageMatcher:
+    def __init__(self, template_cache=None):
+        self.templates = template_cache or TemplateCache()
+        self._frame = None; self._gray = None; self._small = None
+
+    def _prepare(self, frame, region):
+        if region:
+            x, y, w, h = region
+            gray = to_gray(frame[y:y + h, x:x + w])
+            return gray, None
+        if frame is not self._frame:  # full-frame conversions are shared by every lookup on the same capture
+            self._frame = frame; self._gray = to_gray(frame); self._small = None
+        return self._gray, self._small
+
+    def _small_haystack(self, gray, small):
+        if small is not None: return small
+        small = cv2.resize(gray, (int(gray.shape[1] * PYRAMID_SCALE), int(gray.shape[0] * PYRAMID_SCALE)), interpolation=cv2.INTER_AREA)
+        if gray is self._gray: self._small = small
+        return small
+
+    def find(self, frame, template_path, confidence=0.8, region=None):
+        """Return the (x, y) screen centre of the best match at or above confidence, or None."""
+        template = self.templates.get(template_path)
+        if region: region = (max(region[0], 0), max(region[1], 0), region[2], region[3])
+        gray, small = self._prepare(frame, region)
+        th, tw = template.gray.shape
+        if gray.shape[0] < th or gray.shape[1] < tw: return None
+        if template.small is None: score, (mx, my) = self._best(gray, template.gray)
+        else: score, (mx, my) = self._pyramid_match(gray, self._small_haystack(gray, small), template, confidence)
+        if score < confidence: return None
+        offset_x, offset_y = region[:2] if region else (0, 0)
+        return (offset_x + mx + tw // 2, offset_y + my + th // 2)
+
+    @staticmethod
+    def _best(haystack, needle):
+        _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED))
+        return score, loc
+
+    def _pyramid_match(self, gray, small, template, confidence):
+        if small.shape[0] < template.small.shape[0] or small.shape[1] < template.small.shape[1]: return self._best(gray, template.gray)
+        scores = cv2.matchTemplate(small, template.small, cv2.TM_CCOEFF_NORMED).ravel()
+        count = min(MAX_CANDIDATES * 4, scores.size)
+        top = np.argpartition(scores, -count)[-count:]; top = top[np.argsort(scores[top])[::-1]]
+        th, tw = template.gray.shape; pad = int(round(2 / PYRAMID_SCALE)); result_w = small.shape[1] - template.small.shape[1] + 1
+        best = (-1.0, (0, 0)); tried = []
+        for index in top:
+            if scores[index] < confidence - COARSE_SLACK or len(tried) >= MAX_CANDIDATES: break
+            cx = int(index % result_w / PYRAMID_SCALE); cy = int(index // result_w / PYRAMID_SCALE)
+            if any(abs(cx - x) <= pad and abs(cy - y) <= pad for x, y in tried): continue  # neighbour of a window already checked
+            tried.append((cx, cy))
+            x0, y0 = max(cx - pad, 0), max(cy - pad, 0)
+            window = gray[y0:min(cy + th + pad, gray.shape[0]), x0:min(cx + tw + pad, gray.shape[1])]
+            if window.shape[0] < th or window.shape[1] < tw: continue
+            score, (wx, wy) = self._best(window, template.gray)
+            if score > best[0]: best = (score, (x0 + wx, y0 + wy))
+            if score >= 0.99: break
+        return best
+
+    def find_all(self, frame, template_path, confidence=0.8, region=None, overlap=0.5, max_results=500):
+        """Return the screen centres of every non-overlapping match, in reading order, from a single matchTemplate pass."""
+        template = self.templates.get(template_path)
+        if region: region = (max(region[0], 0), max(region[1], 0), region[2], region[3])
+        gray, _ = self._prepare(frame, region)
+        th, tw = template.gray.shape
+        if gray.shape[0] < th or gray.shape[1] < tw: return []
+        scores = cv2.matchTemplate(gray, template.gray, cv2.TM_CCOEFF_NORMED)
+        ys, xs = np.nonzero(scores >= confidence)
+        if not len(xs): return []
+        picks = non_max_suppression(xs, ys, scores[ys, xs], tw, th, overlap, max_results)
+        offset_x, offset_y = region[:2] if region else (0, 0)
+        hits = sorted((int(ys[i]), int(xs[i])) for i in picks)
+        return [(offset_x + x + tw // 2, offset_y + y + th // 2) for y, x in hits]
+
+def non_max_suppression(xs, ys, scores, width, height, overlap=0.5, max_results=500):
+    """Greedy NMS for equally sized boxes; each round suppresses every box overlapping the best remaining one."""
+    order = np.argsort(scores)[::-1]; keep = []
+    area = float(width * height)
+    while order.size and len(keep) < max_results:
+        best = order[0]; keep.append(best); rest = order[1:]
+        inter_w = np.clip(width - np.abs(xs[rest] - xs[best]), 0, None)
+        inter_h = np.clip(height - np.abs(ys[rest] - ys[best]), 0, None)
+        order = rest[inter_w * inter_h / area <= overlap]
+    return keep
@@ -0,0 +1,192 @@
+"""Binary macro files: an 8-byte magic followed by fixed-size records, written as they are recorded and read back in chunks.
+
+Each record is (kind, delay, x, y, code): delay is the seconds elapsed since the previous record, code is a key id, a
+Unicode code point, a mouse button or a packed scroll delta. The recorder writes raw input (moves, button and key down/up,
+scrolls); the older click/key/char kinds are still read, and are what JSON imports produce. JSON macros ([{'type': 'click_location', 'x': .., 'y': ..}, ...]) remain readable and can be
+converted both ways."""
+import json
+import struct
+
+MAGIC = b'NXMACRO\x01'
+RECORD = struct.Struct('<BfhhI')  # 13 bytes; int16 coordinates cover any virtual desktop
+READ_CHUNK = 4096  # records per read while streaming
+MIN_WAIT = 0.2  # recorded gaps shorter than this are not replayed as waits, as with the JSON recorder
+
+WAIT, CLICK, DOUBLE_CLICK, RIGHT_CLICK, KEY, CHAR, KEY_NAME_CHAR, MOVE, SCROLL, BUTTON_DOWN, BUTTON_UP, KEY_DOWN, KEY_UP = range(13)
+BUTTON_NAMES = ('left', 'right', 'middle')
+SCRIPT_BUTTONS = (0, 1)  # script events have left and right clicks, and left drags only
+DRAG_THRESHOLD = 3  # pixels between button down and up before a click counts as a drag
+DOUBLE_CLICK_TIME = 0.3
+SHIFT_KEYS = ('shift', 'shift_l', 'shift_r')
+CLICK_KINDS = {'click_location': CLICK, 'double_click_location': DOUBLE_CLICK, 'right_click_location': RIGHT_CLICK}
+CLICK_NAMES = {kind: name for name, kind in CLICK_KINDS.items()}
+# pynput Key names, which pyautogui.press also accepts; other names are spelled out with KEY_NAME_CHAR records
+KEY_NAMES = ('alt', 'alt_l', 'alt_r', 'alt_gr', 'backspace', 'caps_lock', 'cmd', 'cmd_l', 'cmd_r', 'ctrl', 'ctrl_l', 'ctrl_r', 'delete', 'down',
+             'end', 'enter', 'esc', 'home', 'left', 'page_down', 'page_up', 'right', 'shift', 'shift_l', 'shift_r', 'space', 'tab', 'up',
+             'insert', 'menu', 'num_lock', 'pause', 'print_screen', 'scroll_lock', 'media_play_pause', 'media_volume_mute',
+             'media_volume_down', 'media_volume_up', 'media_previous', 'media_next') + tuple(f'f{i}' for i in range(1, 25))
+KEY_CODES = {name: code for code, name in enumerate(KEY_NAMES)}
+CUSTOM_KEY = 0xFFFFFFFF
+CHAR_FLAG = 0x80000000  # KEY_DOWN/KEY_UP code holding a character rather than a key id
+
+def key_records(name, delay=0.0, kind=KEY):
+    code = KEY_CODES.get(name)
+    if code is not None: return [(kind, delay, 0, 0, code)]
+    return [(KEY_NAME_CHAR, delay if i == 0 else 0.0, 0, 0, ord(ch)) for i, ch in enumerate(name)] + [(kind, 0.0, 0, 0, CUSTOM_KEY)]
+
+def key_name(code, spelled):
+    if code == CUSTOM_KEY: return ''.join(spelled)
+    if code & CHAR_FLAG: return chr(code & ~CHAR_FLAG)
+    return KEY_NAMES[code]
+
+def pack_scroll(dx, dy): return (int(dx) & 0xFFFF) << 16 | (int(dy) & 0xFFFF)
+
+def unpack_scroll(code):
+    dx, dy = code >> 16, code & 0xFFFF
+    return (dx - 0x10000 if dx & 0x8000 else dx), (dy - 0x10000 if dy & 0x8000 else dy)
+
+class MacroWriter:
+    """Appends records to a macro file, flushing every `flush_every` records so a long recording never sits in memory."""
+    def __init__(self, path, flush_every=256):
+        self.path = path; self.flush_every = flush_every; self.count = 0; self.buffer = bytearray()
+        self.file = open(path, 'wb'); self.file.write(MAGIC)
+
+    def write(self, kind, delay=0.0, x=0, y=0, code=0):
+        self.buffer += RECORD.pack(kind, delay, x, y, code); self.count += 1
+        if len(self.buffer) >= self.flush_every * RECORD.size: self.flush()
+
+    def flush(self):
+        if self.buffer: self.file.write(self.buffer); self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed: self.flush(); self.file.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+def is_binary_macro(path):
+    with open(path, 'rb') as f: return f.read(len(MAGIC)) == MAGIC
+
+def iter_records(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC: raise ValueError(f"'{path}' is not a binary macro file")
+        while True:
+            chunk = f.read(RECORD.size * READ_CHUNK)
+            if not chunk: break
+            usable = len(chunk) - len(chunk) % RECORD.size  # a record cut off by an interrupted recording is dropped
+            yield from RECORD.iter_unpack(chunk[:usable])
+
+class _EventBuilder:
+    """Folds records back into script-level events: down/up pairs become clicks, double clicks or drags, and
+    consecutive characters become one 'type'. Pointer moves and key releases carry no script-level meaning and are skipped,
+    as are middle clicks and right drags, which scripts cannot express."""
+    def __init__(self, min_wait):
+        self.min_wait = min_wait; self.time = 0.0; self.last_end = 0.0; self.text = []; self.spelled = []
+        self.held = None; self.held_at = None; self.down = None
+
+    def _begin(self, start):
+        out = self.flush()
+        if start - self.last_end > self.min_wait: out.append({'type': 'wait', 'duration': round(start - self.last_end, 2)})
+        return out
+
+    def _emit(self, event, start, end, hold=False):
+        out = self._begin(start)
+        if hold: self.held = event; self.held_at = start  # a click waits here in case the next one makes it a double click
+        else: out.append(event)
+        self.last_end = end
+        return out
+
+    def flush(self):
+        out = []
+        if self.held: out.append(self.held); self.held = None
+        if self.text: out.append({'type': 'type', 'text': ''.join(self.text)}); self.text = []
+        return out
+
+    def feed(self, kind, delay, x, y, code):
+        self.time += delay; now = self.time
+        if kind == WAIT:
+            out = self.flush(); out.append({'type': 'wait', 'duration': round(delay, 2)}); self.last_end = now; return out
+        if kind == KEY_NAME_CHAR: self.spelled.append(chr(code)); return []
+        if kind in (CHAR, KEY_DOWN, KEY):
+            name = chr(code) if kind == CHAR else key_name(code, self.spelled); self.spelled = []
+            if kind == CHAR or (code & CHAR_FLAG and code != CUSTOM_KEY):
+                if not (self.text and now - self.last_end <= self.min_wait): out = self._begin(now)
+                else: out = []
+                self.text.append(name); self.last_end = now; return out
+            if kind == KEY_DOWN and name in SHIFT_KEYS: return []  # typed characters already carry their case
+            return self._emit({'type': 'key', 'key_name': name}, now, now)
+        if kind in CLICK_NAMES: return self._emit({'type': CLICK_NAMES[kind], 'x': x, 'y': y}, now, now)
+        if kind == BUTTON_DOWN: self.down = (code, x, y, now); return []
+        if kind == BUTTON_UP and self.down:
+            button, x1, y1, started = self.down; self.down = None
+            dragged = abs(x - x1) > DRAG_THRESHOLD or abs(y - y1) > DRAG_THRESHOLD
+            if button not in SCRIPT_BUTTONS or (dragged and button != 0): return []  # no script form: dropped, not replayed as a left click
+            if dragged:
+                return self._emit({'type': 'click_and_drag', 'x1': x1, 'y1': y1, 'x2': x, 'y2': y, 'duration': round(now - started, 2)}, started, now)
+            held = self.held
+            if button == 0 and held and held['type'] == 'click_location' and (held['x'], held['y']) == (x1, y1) and started - self.held_at < DOUBLE_CLICK_TIME:
+                held['type'] = 'double_click_location'; self.last_end = now; return []
+            return self._emit({'type': 'right_click_location' if button == 1 else 'click_location', 'x': x1, 'y': y1}, started, now, hold=True)
+        if kind == SCROLL:
+            dx, dy = unpack_scroll(code)
+            return self._emit({'type': 'scroll', 'amount': dy}, now, now) if dy else []
+        return []
+
+def records_to_events(records, min_wait=MIN_WAIT):
+    """Turn records into JSON-style event dicts (the lossy, script-level view of a recording)."""
+    builder = _EventBuilder(min_wait)
+    for record in records: yield from builder.feed(*record)
+    yield from builder.flush()
+
+def events_to_records(events):
+    for event in events:
+        kind = event['type']
+        if kind == 'wait': yield (WAIT, float(event['duration']), 0, 0, 0)
+        elif kind in CLICK_KINDS: yield (CLICK_KINDS[kind], 0.0, int(event['x']), int(event['y']), 0)
+        elif kind == 'type': yield from ((CHAR, 0.0, 0, 0, ord(ch)) for ch in event['text'])
+        elif kind == 'key': yield from key_records(event['key_name'])
+        elif kind == 'scroll': yield (SCROLL, 0.0, 0, 0, pack_scroll(0, event['amount']))
+        elif kind == 'click_and_drag':
+            x1, y1, x2, y2 = (int(event[k]) for k in ('x1', 'y1', 'x2', 'y2'))
+            yield (MOVE, 0.0, x1, y1, 0); yield (BUTTON_DOWN, 0.0, x1, y1, 0)
+            yield (MOVE, float(event['duration']), x2, y2, 0); yield (BUTTON_UP, 0.0, x2, y2, 0)
+        else: raise ValueError(f"Unknown macro event type '{kind}'")
+
+def read_macro(path):
+    """Yield the events of a binary or JSON macro; binary files are streamed, JSON ones loaded whole."""
+    if is_binary_macro(path): yield from records_to_events(iter_records(path)); return
+    with open(path, 'r') as f: yield from json.load(f)
+
+def timed_events(path):
+    """Yield (seconds since the start of the recording, event) for playback scheduling.
+
+    Binary macros keep every recorded gap, so each typed character gets its own timestamp; JSON macros only have
+    their explicit waits to go by."""
+    offset = 0.0
+    if is_binary_macro(path):
+        spelled = []
+        for kind, delay, x, y, code in iter_records(path):
+            offset += delay
+            if kind == MOVE: yield offset, {'type': 'mouse_move', 'x': x, 'y': y}
+            elif kind in (BUTTON_DOWN, BUTTON_UP): yield offset, {'type': 'mouse_down' if kind == BUTTON_DOWN else 'mouse_up', 'x': x, 'y': y, 'button': BUTTON_NAMES[code]}
+            elif kind == SCROLL: dx, dy = unpack_scroll(code); yield offset, {'type': 'mouse_scroll', 'x': x, 'y': y, 'dx': dx, 'dy': dy}
+            elif kind == KEY_NAME_CHAR: spelled.append(chr(code))
+            elif kind in (KEY_DOWN, KEY_UP): yield offset, {'type': 'key_down' if kind == KEY_DOWN else 'key_up', 'key_name': key_name(code, spelled)}; spelled = []
+            elif kind == CHAR: yield offset, {'type': 'type', 'text': chr(code)}
+            elif kind in CLICK_NAMES: yield offset, {'type': CLICK_NAMES[kind], 'x': x, 'y': y}
+            elif kind == KEY: yield offset, {'type': 'key', 'key_name': key_name(code, spelled)}; spelled = []
+        return
+    with open(path, 'r') as f: events = json.load(f)
+    for event in events:
+        if event['type'] == 'wait': offset += float(event['duration'])
+        else: yield offset, event
+
+def export_json(src, dest):
+    events = list(read_macro(src))
+    with open(dest, 'w') as f: json.dump(events, f, indent=4)
+
+def import_json(src, dest):
+    with open(src, 'r') as f: events = json.load(f)
+    with MacroWriter(dest) as writer:
+        for record in events_to_records(events): writer.write(*record)
@@ -0,0 +1,76 @@
+"""Turns recorded macro events into a shorter script: merged and rounded waits, repeated keys as counts, repeated patterns as loops."""
+from macro_format import MIN_WAIT
+from screen_backend import PYAUTOGUI_PAUSE
+
+TYPE_INTERVAL = 0.05  # handle_type's per-character interval
+CLICK_INTERVAL = 0.1  # perform_mouse_action passes interval=0.1 to click
+WAIT_PRECISION = 0.1  # waits are rounded to this, which also lets near-identical repetitions fold into a loop
+MIN_REPEATS = 3
+MAX_PERIOD = 8  # longest repeated pattern, in lines, that is folded into a loop
+
+def event_line(event):
+    kind = event['type']
+    if kind == 'wait': return f"wait {event['duration']}"
+    if kind in ('click_location', 'double_click_location', 'right_click_location'): return f"{kind} {event['x']} {event['y']}"
+    if kind == 'type': return f"type \"{event['text']}\""
+    if kind == 'key': return f"key {event['key_name']}" + (f" {event['count']}" if event.get('count', 1) > 1 else '')
+    if kind == 'click_and_drag': return f"click_and_drag {event['x1']} {event['y1']} {event['x2']} {event['y2']} {event['duration']}"
+    if kind == 'scroll': return f"scroll {event['amount']}"
+    return None
+
+def estimated_seconds(event):
+    """Rough wall time of the script line for an event: explicit waits plus pyautogui's built-in pauses."""
+    kind = event['type']
+    if kind == 'wait': return float(event['duration'])
+    if kind == 'type': return len(event['text']) * TYPE_INTERVAL + PYAUTOGUI_PAUSE
+    if kind == 'click_and_drag': return float(event['duration']) + 2 * PYAUTOGUI_PAUSE
+    if kind in ('click_location', 'double_click_location'): return CLICK_INTERVAL + PYAUTOGUI_PAUSE
+    return PYAUTOGUI_PAUSE  # one press(presses=n) call pauses once, however many presses
+
+class OptimizeReport:
+    def __init__(self, lines_before, lines_after, seconds_before, seconds_after):
+        self.lines_before = lines_before; self.lines_after = lines_after
+        self.seconds_before = seconds_before; self.seconds_after = seconds_after
+
+    def summary(self):
+        return (f"Macro optimizer: {self.lines_before} -> {self.lines_after} lines, "
+                f"est. runtime {self.seconds_before:.1f}s -> {self.seconds_after:.1f}s ({self.seconds_before - self.seconds_after:.1f}s saved)")
+
+def merge_events(events, min_wait=MIN_WAIT, precision=WAIT_PRECISION):
+    """Merge adjacent waits, drop those under min_wait, round the rest, and count runs of the same key."""
+    merged = []; pending_wait = 0.0
+    for event in events:
+        if event['type'] == 'wait': pending_wait += float(event['duration']); continue
+        if pending_wait >= min_wait: merged.append({'type': 'wait', 'duration': round(round(pending_wait / precision) * precision, 2)})
+        pending_wait = 0.0
+        previous = merged[-1] if merged else None
+        if event['type'] == 'key' and previous and previous['type'] == 'key' and previous['key_name'] == event['key_name']:
+            previous['count'] = previous.get('count', 1) + 1
+        else: merged.append(dict(event))
+    if pending_wait >= min_wait: merged.append({'type': 'wait', 'duration': round(round(pending_wait / precision) * precision, 2)})
+    return merged
+
+def fold_loops(lines, min_repeats=MIN_REPEATS, max_period=MAX_PERIOD):
+    """Replace a block of lines repeated back to back at least min_repeats times with a loop, whenever that shortens the script."""
+    out = []; i = 0; n = len(lines)
+    while i < n:
+        best = None  # (lines saved, period, repeats)
+        for period in range(1, min(max_period, (n - i) // min_repeats) + 1):
+            body = lines[i:i + period]; repeats = 1
+            while lines[i + repeats * period:i + (repeats + 1) * period] == body: repeats += 1
+            saved = period * repeats - (period + 2)
+            if repeats >= min_repeats and saved > 0 and (best is None or saved > best[0]): best = (saved, period, repeats)
+        if best is None: out.append(lines[i]); i += 1; continue
+        _, period, repeats = best
+        out.append(f"loop {repeats}"); out += ['  ' + line for line in lines[i:i + period]]; out.append("endloop")
+        i += period * repeats
+    return out
+
+def optimize_events(events, min_wait=MIN_WAIT, precision=WAIT_PRECISION, min_repeats=MIN_REPEATS, max_period=MAX_PERIOD):
+    """Return (script lines, OptimizeReport) for a recorded event stream."""
+    events = list(events)
+    naive = [line for line in map(event_line, events) if line]
+    merged = merge_events(events, min_wait, precision)
+    lines = fold_loops([line for line in map(event_line, merged) if line], min_repeats, max_period)
+    report = OptimizeReport(len(naive), len(lines), sum(estimated_seconds(e) for e in events if event_line(e)), sum(estimated_seconds(e) for e in merged if event_line(e)))
+    return lines, report
@@ -0,0 +1,70 @@
+import time
+import numpy as np
+
+MIN_SPEED, MAX_SPEED = 0.5, 10.0
+IDLE_GAP = 0.2  # in no-wait mode, gaps longer than this are dropped entirely
+SPIN_WINDOW = 0.002  # sleep until this close to the target, then yield-spin for the rest
+CHECK_INTERVAL = 0.05  # longest uninterrupted sleep, so a stop request is noticed quickly
+MOVE_STEP = 1 / 60  # simplified pointer paths are re-sampled at this interval so drags move smoothly
+MAX_INTERPOLATED_GAP = 2.0
+# pynput key names whose pyautogui spelling is not simply the name without underscores
+PYAUTOGUI_KEYS = {'alt_l': 'altleft', 'alt_r': 'altright', 'alt_gr': 'altright', 'ctrl_l': 'ctrlleft', 'ctrl_r': 'ctrlright', 'shift_l': 'shiftleft',
+                  'shift_r': 'shiftright', 'cmd': 'win', 'cmd_l': 'winleft', 'cmd_r': 'winright', 'menu': 'apps', 'media_play_pause': 'playpause',
+                  'media_volume_mute': 'volumemute', 'media_volume_down': 'volumedown', 'media_volume_up': 'volumeup',
+                  'media_previous': 'prevtrack', 'media_next': 'nexttrack'}
+
+def pyautogui_key(name): return PYAUTOGUI_KEYS.get(name) or (name.replace('_', '') if len(name) > 1 else name)
+
+def interpolate_moves(timed_events, step=MOVE_STEP, max_gap=MAX_INTERPOLATED_GAP):
+    """Fill in straight-line pointer positions between recorded moves, like click_and_drag's motion, at `step` intervals."""
+    last = None  # (offset, x, y) of the last known pointer position
+    for offset, event in timed_events:
+        if event['type'] == 'mouse_move' and last is not None:
+            start, x0, y0 = last; gap = offset - start; x1, y1 = event['x'], event['y']
+            steps = int(gap / step) if gap <= max_gap and (x1, y1) != (x0, y0) else 0
+            for i in range(1, steps):
+                f = i / steps; yield start + gap * f, {'type': 'mouse_move', 'x': round(x0 + (x1 - x0) * f), 'y': round(y0 + (y1 - y0) * f)}
+        if event['type'] in ('mouse_move', 'mouse_down', 'mouse_up', 'mouse_scroll'): last = (offset, event['x'], event['y'])
+        yield offset, event
+
+class PlaybackStats:
+    """How late each event fired relative to its scheduled time."""
+    def __init__(self, speed, no_wait):
+        self.speed = speed; self.no_wait = no_wait; self.lateness = []; self.recorded = 0.0; self.elapsed = 0.0
+
+    def summary(self):
+        if not self.lateness: return "Playback timing: no events played."
+        late = np.array(self.lateness) * 1000.0
+        mode = f"{self.speed:g}x" + (", no-wait" if self.no_wait else "")
+        return (f"Playback timing ({mode}): {len(late)} events in {self.elapsed:.2f}s (recorded {self.recorded:.2f}s), "
+                f"drift mean {late.mean():.1f}ms, p95 {np.percentile(late, 95):.1f}ms, max {late.max():.1f}ms")
+
+class MacroPlayer:
+    """Fires each event at its recorded offset (scaled by speed) on the monotonic clock.
+
+    Targets are absolute, so time spent inside a slow action is absorbed by the next gap instead of accumulating.
+    clock/sleep may be a replay screen's virtual clock, which is not spun on (spin=False) but jumped to each target."""
+    def __init__(self, perform, should_continue, speed=1.0, no_wait=False, clock=time.monotonic, sleep=time.sleep, spin=True):
+        self.perform = perform; self.should_continue = should_continue; self.clock = clock; self.sleep = sleep; self.spin = spin
+        self.speed = min(max(float(speed), MIN_SPEED), MAX_SPEED); self.no_wait = no_wait
+
+    def _wait_until(self, target):
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0 or not self.should_continue(): return
+            if not self.spin: self.sleep(remaining); return
+            if remaining > SPIN_WINDOW: self.sleep(min(remaining - SPIN_WINDOW, CHECK_INTERVAL))
+            else: self.sleep(0)
+
+    def play(self, timed_events):
+        stats = PlaybackStats(self.speed, self.no_wait); start = self.clock(); previous = 0.0; dropped = 0.0
+        for offset, event in timed_events:
+            if not self.should_continue(): break
+            if self.no_wait and offset - previous > IDLE_GAP: dropped += offset - previous
+            previous = offset; target = start + (offset - dropped) / self.speed
+            self._wait_until(target)
+            if not self.should_continue(): break
+            stats.lateness.append(max(self.clock() - target, 0.0))
+            self.perform(event)
+        stats.recorded = previous; stats.elapsed = self.clock() - start
+        return stats
@@ -1,78 +1,146 @@
+import os
+import tempfile
+import threading
 import time
+import numpy as np
 from pynput import mouse, keyboard
+from macro_format import BUTTON_DOWN, BUTTON_NAMES, BUTTON_UP, CHAR_FLAG, KEY_CODES, KEY_DOWN, KEY_UP, MOVE, SCROLL, MacroWriter, pack_scroll
+
+RING_CAPACITY = 1 << 16  # raw events buffered between the input hooks and the writer thread
+STROKE_CAPACITY = 512  # pointer samples simplified at a time
+PATH_TOLERANCE = 2.0  # pixels a simplified path may deviate from the recorded one
+STROKE_GAP = 0.1  # a pause in pointer movement this long ends a stroke, so the pause keeps its timing
+DRAIN_INTERVAL = 0.02
+RING_DTYPE = np.dtype([('kind', 'u1'), ('t', 'f8'), ('x', 'i4'), ('y', 'i4'), ('code', 'u4')])
+
+def simplify_path(points, tolerance=PATH_TOLERANCE):
+    """Ramer-Douglas-Peucker over an (n, 2) array; returns a mask of the points to keep (always the first and last)."""
+    count = len(points); keep = np.zeros(count, dtype=bool)
+    if count == 0: return keep
+    keep[0] = keep[-1] = True; stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2: continue
+        segment = points[last] - points[first]; rest = points[first + 1:last] - points[first]
+        length = np.hypot(*segment)
+        distance = np.abs(segment[0] * rest[:, 1] - segment[1] * rest[:, 0]) / length if length else np.hypot(rest[:, 0], rest[:, 1])
+        worst = int(np.argmax(distance))
+        if distance[worst] > tolerance:
+            split = first + 1 + worst; keep[split] = True; stack += [(first, split), (split, last)]
+    return keep
+
+class EventRing:
+    """Fixed-size buffer the input hooks append to; it never allocates per event, and overflows drop new events."""
+    def __init__(self, capacity=RING_CAPACITY):
+        self.buffer = np.zeros(capacity, dtype=RING_DTYPE); self.capacity = capacity
+        self.head = 0; self.tail = 0; self.dropped = 0; self.lock = threading.Lock()
+
+    def push(self, kind, x=0, y=0, code=0):
+        with self.lock:
+            if self.head - self.tail >= self.capacity: self.dropped += 1; return
+            self.buffer[self.head % self.capacity] = (kind, time.perf_counter(), x, y, code); self.head += 1
+
+    def pop_all(self):
+        with self.lock:
+            start, end = self.tail % self.capacity, self.head % self.capacity; count = self.head - self.tail
+            if not count: return self.buffer[:0]
+            items = self.buffer[start:start + count].copy() if start + count <= self.capacity else np.concatenate((self.buffer[start:], self.buffer[:end]))
+            self.tail = self.head
+        return items
+
+class PathSimplifier:
+    """Collects pointer samples into strokes and passes only the simplified points on to `write`."""
+    def __init__(self, write, tolerance=PATH_TOLERANCE, capacity=STROKE_CAPACITY):
+        self.write = write; self.tolerance = tolerance
+        self.samples = np.empty((capacity, 3)); self.count = 0; self.anchored = False  # samples[0] already written
+
+    def add(self, t, x, y):
+        if self.count and t - self.samples[self.count - 1, 0] > STROKE_GAP: self.flush()
+        if self.count == len(self.samples): self.flush(keep_last=True)
+        self.samples[self.count] = (t, x, y); self.count += 1
+
+    def flush(self, keep_last=False):
+        if not self.count: return
+        samples = self.samples[:self.count]
+        for i in np.flatnonzero(simplify_path(samples[:, 1:], self.tolerance))[1 if self.anchored else 0:]:
+            t, x, y = samples[i]; self.write(MOVE, t, int(x), int(y), 0)
+        if keep_last: self.samples[0] = samples[-1]; self.count = 1; self.anchored = True
+        else: self.count = 0; self.anchored = False
 
 class MacroRecorder:
+    """Captures moves, scrolls, button and key down/up into a ring buffer; a writer thread simplifies pointer paths and streams records to disk."""
     def __init__(self):
-        self.events = []
-        self.last_time = None
+        self.path = None
+        self.writer = None
+        self.ring = None
+        self.simplifier = None
+        self.last_written = None
+        self.drain_thread = None
+        self.stop_event = threading.Event()
         self.mouse_listener = None
         self.keyboard_listener = None
         self.is_recording = False
-        self.last_click_time = 0
-        self.last_click_pos = (0, 0)
 
-    def start_recording(self):
+    def start_recording(self, path=None):
         if self.is_recording: return
-        self.events = []; self.last_time = time.time(); self.is_recording = True
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.macro'); os.close(fd)
+        self.path = path; self.writer = MacroWriter(path); self.ring = EventRing(); self.simplifier = PathSimplifier(self._write)
+        self.last_written = time.perf_counter(); self.stop_event.clear(); self.is_recording = True
+        self.drain_thread = threading.Thread(target=self._drain_loop, daemon=True); self.drain_thread.start()
 
         # Use a non-blocking listener setup
-        self.mouse_listener = mouse.Listener(on_click=self.on_click)
-        self.keyboard_listener = keyboard.Listener(on_press=self.on_press)
-        
+        self.mouse_listener = mouse.Listener(on_move=self.on_move, on_click=self.on_click, on_scroll=self.on_scroll)
+        self.keyboard_listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+
         self.mouse_listener.start()
         self.keyboard_listener.start()
 
     def stop_recording(self):
+        """Return the path of the finished recording, or None if nothing was recorded."""
         if not self.is_recording: return None
         if self.mouse_listener: self.mouse_listener.stop()
         if self.keyboard_listener: self.keyboard_listener.stop()
         self.is_recording = False
-        return self.events
-
-    def add_event(self, event_type, **kwargs):
-        current_time = time.time()
-        delay = current_time - self.last_time
-        self.last_time = current_time
-        
-        if delay > 0.2: # Only record meaningful waits to avoid clutter
-            self.events.append({'type': 'wait', 'duration': round(delay, 2)})
-            
-        event_data = {'type': event_type, **kwargs}
-        self.events.append(event_data)
+        self.stop_event.set(); self.drain_thread.join()
+        if self.ring.dropped: print(f"Macro recorder dropped {self.ring.dropped} events (buffer full)")
+        self.writer.close()
+        if not self.writer.count: os.remove(self.path); return None
+        return self.path
+
+    def _write(self, kind, t, x, y, code):
+        self.writer.write(kind, t - self.last_written, x, y, code); self.last_written = t
+
+    def _drain(self):
+        for kind, t, x, y, code in self.ring.pop_all().tolist():
+            if kind == MOVE: self.simplifier.add(t, x, y); continue
+            self.simplifier.flush(); self._write(kind, t, x, y, code)
+
+    def _drain_loop(self):
+        while not self.stop_event.wait(DRAIN_INTERVAL): self._drain()
+        self._drain(); self.simplifier.flush()
+
+    def on_move(self, x, y):
+        if self.is_recording: self.ring.push(MOVE, x, y)
 
     def on_click(self, x, y, button, pressed):
-        if not pressed or not self.is_recording: return
-
-        click_type = 'click_location'
-        if button == mouse.Button.right:
-            click_type = 'right_click_location'
-        
-        current_click_time = time.time()
-        
-        # Check for double-click
-        if (current_click_time - self.last_click_time) < 0.3 and self.last_click_pos == (x,y):
-            # It's a double click if it's fast and at the same spot
-            # Remove the previous single click and its preceding wait
-            if len(self.events) >= 2 and self.events[-1]['type'] == 'click_location':
-                self.events.pop() # remove click
-                if self.events and self.events[-1]['type'] == 'wait':
-                    self.events.pop() # remove wait
-            click_type = 'double_click_location'
-
-        self.add_event(click_type, x=x, y=y)
-        self.last_click_time = current_click_time
-        self.last_click_pos = (x, y)
+        if not self.is_recording or button.name not in BUTTON_NAMES: return  # side buttons (x1/x2) have no playback equivalent
+        self.ring.push(BUTTON_DOWN if pressed else BUTTON_UP, x, y, BUTTON_NAMES.index(button.name))
+
+    def on_scroll(self, x, y, dx, dy):
+        if self.is_recording: self.ring.push(SCROLL, x, y, pack_scroll(dx, dy))
+
+    def _key_code(self, key):
+        if isinstance(key, keyboard.KeyCode) and key.char: return CHAR_FLAG | ord(key.char)
+        if isinstance(key, keyboard.Key): return KEY_CODES.get(key.name)
+        return None  # e.g. a bare virtual-key code with no character; pyautogui could not replay it anyway
 
     def on_press(self, key):
         if not self.is_recording: return
-        
-        try:
-            if isinstance(key, keyboard.KeyCode) and key.char:
-                if self.events and self.events[-1]['type'] == 'type':
-                    self.events[-1]['text'] += key.char
-                else:
-                    self.add_event('type', text=key.char)
-            elif isinstance(key, keyboard.Key):
-                self.add_event('key', key_name=key.name)
-        except Exception as e:
-            print(f"Could not record key: {e}")
\ No newline at end of file
+        code = self._key_code(key)
+        if code is not None: self.ring.push(KEY_DOWN, code=code)
+
+    def on_release(self, key):
+        if not self.is_recording: return
+        code = self._key_code(key)
+        if code is not None: self.ring.push(KEY_UP, code=code)
@@ -1,10 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-import os, sys, threading, subprocess, logging, re, json, shutil, sv_ttk
+import os, sys, time, threading, subprocess, logging, logging.handlers, queue, collections, re, shutil, multiprocessing, sv_ttk
 from key_binder import KeyBinder
 from script_engine import ScriptEngine, ScriptExitException
 from script_manager import ScriptManager
 from macro_recorder import MacroRecorder
+from workspace_index import WorkspaceIndex
+from macro_format import export_json, read_macro
+from macro_optimizer import optimize_events
 from pynput import mouse
 import pyautogui
 
@@ -51,21 +54,73 @@ class TextLineNumbers(tk.Canvas):
             if dline is None: break
             y = dline[1]; linenum = str(i).split(".")[0]
             self.create_text(2, y, anchor="nw", text=linenum, fill="#606366", font=("Segoe UI", 9)); i = self.textwidget.index("%s+1line" % i)
+TOKEN_PATTERN = re.compile(r'(?P<comment>#.*)|(?P<string>\"[^\"\n]*\")|(?P<command>\b(?:click|double_click|right_click|move_to|scroll|click_and_drag|wait|delay|loop|endloop|foreach|endforeach|find_all|count_color|break|if|endif|eval|var|script|return|popup|log|select_window|key|type|playback|get_text|sound|screenshot|exit|mouse_pos|frame_cache|ocr_workers|ocr_tiles|search_region)\w*\b)|(?P<variable>\$\w+)|(?P<number>\b-?\d+(?:\.\d+)?\b)|(?P<operator>[\+\-\*/<>=!]=?)', re.IGNORECASE)
+TOKEN_TAGS = ('comment', 'string', 'command', 'variable', 'number', 'operator')
 class SyntaxHighlighter:
+    """Re-tokenizes only the edited lines and the viewport after a short idle delay; tags move with the text, so the rest stays valid."""
+    DEBOUNCE_MS = 40; CHUNK_LINES = 400
     def __init__(self, text_widget):
         self.text = text_widget; self.text.bind("<<Modified>>", self.on_text_modified, add=True)
-        self.patterns = { 'comment': r'#.*', 'command': r'\b(click|double_click|right_click|move_to|scroll|click_and_drag|wait|delay|loop|endloop|break|if|endif|eval|var|script|popup|log|select_window|key|type|playback|get_text|sound|screenshot|exit|mouse_pos)\w*\b', 'string': r'\"[^\"\n]*\"', 'number': r'\b-?\d+(\.\d+)?\b', 'operator': r'[\+\-\*/<>=!]=?', 'variable': r'\$\w+' }
         self.text.tag_configure("command", foreground="#0000ff"); self.text.tag_configure("string", foreground="#A31515"); self.text.tag_configure("comment", foreground="#008000"); self.text.tag_configure("number", foreground="#881391"); self.text.tag_configure("operator", foreground="#881391"); self.text.tag_configure("variable", foreground="#001080", font=("Segoe UI", 10, "italic"))
+        self._job = None; self._dirty = None; self._line_count = 1; self._generation = 0
+    def _line(self, index): return int(self.text.index(index).split('.')[0])
     def on_text_modified(self, event=None):
-        if self.text.edit_modified(): self.highlight_all(); self.text.edit_modified(False)
+        if not self.text.edit_modified(): return
+        self.text.edit_modified(False)
+        line = self._line("insert"); total = self._line("end-1c"); added = max(total - self._line_count, 0); self._line_count = total
+        first, last = max(line - added, 1), line  # a paste or newline leaves the cursor on the last inserted line
+        if self._dirty: first, last = min(first, self._dirty[0]), max(last, self._dirty[1])
+        self._dirty = (first, last)
+        if self._job: self.text.after_cancel(self._job)
+        self._job = self.text.after(self.DEBOUNCE_MS, self.flush)
+    def flush(self):
+        self._job = None; dirty, self._dirty = self._dirty, None
+        top, bottom = self._line("@0,0"), self._line(f"@0,{self.text.winfo_height()}")
+        if dirty and dirty[0] <= bottom + 1 and dirty[1] >= top - 1: top, bottom = min(top, dirty[0]), max(bottom, dirty[1])
+        elif dirty: self.highlight_lines(*dirty)
+        self.highlight_lines(top, bottom)
+    def highlight_lines(self, first, last):
+        last = min(last, self._line("end-1c"))
+        if last < first: return
+        start, end = f"{first}.0", f"{last}.end"; ranges = {tag: [] for tag in TOKEN_TAGS}
+        for row, line in enumerate(self.text.get(start, end).split('\n'), first):
+            for match in TOKEN_PATTERN.finditer(line): ranges[match.lastgroup] += (f"{row}.{match.start()}", f"{row}.{match.end()}")
+        for tag, indices in ranges.items():
+            self.text.tag_remove(tag, start, end)
+            if indices: self.text.tag_add(tag, *indices)
     def highlight_all(self):
-        for tag in self.text.tag_names():
-            if tag != "sel": self.text.tag_remove(tag, "1.0", "end")
-        for tag, pattern in self.patterns.items(): self.apply_tag(tag, pattern)
-    def apply_tag(self, tag, pattern):
-        content = self.text.get("1.0", "end")
-        for match in re.finditer(pattern, content, re.IGNORECASE):
-            start, end = match.span(); self.text.tag_add(tag, f"1.0 + {start} chars", f"1.0 + {end} chars")
+        """Highlight the viewport now and the rest of the document in chunks on the event loop, so loading a large script stays responsive."""
+        self._generation += 1; self._line_count = self._line("end-1c")
+        self.highlight_lines(self._line("@0,0"), self._line(f"@0,{self.text.winfo_height()}"))
+        self._highlight_chunk(1, self._generation)
+    def _highlight_chunk(self, first, generation):
+        if generation != self._generation: return  # superseded by a newer load
+        last = min(first + self.CHUNK_LINES - 1, self._line("end-1c")); self.highlight_lines(first, last)
+        if last < self._line("end-1c"): self.text.after(1, self._highlight_chunk, last + 1, generation)
+
+class OutputConsole:
+    """Console Text fed from a queue: any thread appends, the Tk loop drains it in one insert per frame and keeps at most max_lines."""
+    def __init__(self, text_widget, max_lines=5000, interval_ms=50):
+        self.text = text_widget; self.max_lines = max_lines; self.interval_ms = interval_ms
+        self.pending = collections.deque(); self._job = None
+    def push(self, message): self.pending.append(message)  # deque.append is atomic, so worker threads never block on the UI
+    def start(self): self._job = self.text.after(self.interval_ms, self.drain)
+    def stop(self):
+        if self._job: self.text.after_cancel(self._job); self._job = None
+    def drain(self):
+        count = len(self.pending)
+        if count:
+            messages = [self.pending.popleft() for _ in range(count)]
+            if count > self.max_lines:
+                messages = [f"... {count - self.max_lines} lines skipped (see automation.log)"] + messages[-self.max_lines:]
+            follow = self.text.yview()[1] >= 0.999
+            self.text.config(state='normal'); self.text.insert(tk.END, '\n'.join(messages) + '\n')
+            lines = int(self.text.index('end-1c').split('.')[0]) - 1  # messages may span lines; the text ends with a newline
+            if lines > self.max_lines: self.text.delete("1.0", f"{lines - self.max_lines + 1}.0")
+            self.text.config(state='disabled')
+            if follow: self.text.see(tk.END)
+        self._job = self.text.after(self.interval_ms, self.drain)
+    def clear(self): self.pending.clear(); self.text.config(state='normal'); self.text.delete("1.0", tk.END); self.text.config(state='disabled')
 
 class PixelColorDialog(tk.Toplevel):
     def __init__(self, parent, x, y, initial_color, callback):
@@ -106,7 +161,11 @@ class AutomationApp:
         self.script_manager = ScriptManager(); self.engine = ScriptEngine(self.update_output, self.update_status, self.show_popup)
         if file_to_open: self.load_script_from_path(file_to_open)
 
-    def setup_logging(self): logging.basicConfig(filename='automation.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'); self.logger = logging.getLogger()
+    def setup_logging(self):
+        # Records are queued and written by a listener thread, so logging never does file I/O on the GUI or script thread
+        file_handler = logging.FileHandler('automation.log', encoding='utf-8'); file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        log_queue = queue.SimpleQueue(); self.log_listener = logging.handlers.QueueListener(log_queue, file_handler); self.log_listener.start()
+        self.logger = logging.getLogger(); self.logger.setLevel(logging.INFO); self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
     def show_popup(self, message): self.root.after(0, lambda: messagebox.showinfo("Script Message", message))
     def setup_keybinds(self):
         self.keybinder = KeyBinder(); self.keybinder.load_keybinds()
@@ -123,6 +182,7 @@ class AutomationApp:
         self.tree = ttk.Treeview(explorer_frame, selectmode="browse"); self.tree.grid(row=1, column=0, sticky="ns")
         tree_scroll = ttk.Scrollbar(explorer_frame, orient="vertical", command=self.tree.yview); tree_scroll.grid(row=1, column=1, sticky="ns")
         self.tree.configure(yscrollcommand=tree_scroll.set); self.tree.bind("<Double-1>", self.on_tree_double_click); self.tree.bind("<Button-3>", self.on_tree_right_click)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open); self.workspace_index = WorkspaceIndex(); self.tree_nodes = {}; self.drain_explorer_events()
         main_paned_window = ttk.PanedWindow(self.main_frame, orient=tk.HORIZONTAL); main_paned_window.grid(row=0, column=1, sticky="nsew", padx=10)
         editor_console_pane = ttk.PanedWindow(main_paned_window, orient=tk.VERTICAL)
         editor_outer_frame = ttk.LabelFrame(editor_console_pane, text="Script Editor", padding=5)
@@ -138,6 +198,7 @@ class AutomationApp:
         self.output = tk.Text(output_frame, height=10, state='disabled', font=("Consolas", 10), wrap="word", relief="flat"); self.output.grid(row=0, column=0, sticky="nsew")
         output_scrollbar = ttk.Scrollbar(output_frame, orient=tk.VERTICAL, command=self.output.yview); output_scrollbar.grid(row=0, column=1, sticky="ns")
         self.output['yscrollcommand'] = output_scrollbar.set; editor_console_pane.add(output_frame, weight=1)
+        self.console = OutputConsole(self.output); self.console.start()
         main_paned_window.add(editor_console_pane, weight=3)
         cmd_outer_frame = ttk.LabelFrame(main_paned_window, text="Commands", padding=5); cmd_outer_frame.rowconfigure(0, weight=1); cmd_outer_frame.columnconfigure(0, weight=1)
         cmd_canvas = tk.Canvas(cmd_outer_frame, borderwidth=0, highlightthickness=0); cmd_scrollbar = ttk.Scrollbar(cmd_outer_frame, orient="vertical", command=cmd_canvas.yview)
@@ -156,6 +217,9 @@ class AutomationApp:
         filemenu.add_separator(); filemenu.add_command(label="Exit", accelerator="Ctrl+Q", command=self.quit_app)
         settingsmenu.add_command(label="Configure Keybinds...", command=self.open_keybind_settings)
         settingsmenu.add_command(label="Record Macro...", command=self.toggle_macro_recorder)
+        self.profile_var = tk.BooleanVar(value=False)
+        settingsmenu.add_separator(); settingsmenu.add_checkbutton(label="Profile Script Runs", variable=self.profile_var, command=lambda: setattr(self.engine, 'profiling', self.profile_var.get()))
+        self.record_run_var = tk.BooleanVar(value=False); settingsmenu.add_checkbutton(label="Record Screen During Runs", variable=self.record_run_var)
         menubar.add_cascade(label="File", menu=filemenu); menubar.add_cascade(label="Settings", menu=settingsmenu); self.root.config(menu=menubar)
         self.root.bind_all("<Control-n>", lambda e: subprocess.Popen([sys.executable, sys.argv[0]])); self.root.bind_all("<Control-o>", lambda e: self.open_workspace()); self.root.bind_all("<Control-s>", lambda e: self.save_script()); self.root.bind_all("<Control-S>", lambda e: self.save_script_as()); self.root.bind_all("<Control-q>", lambda e: self.quit_app()); self.root.bind_all("<Control-w>", lambda e: self.quit_app())
     
@@ -163,7 +227,7 @@ class AutomationApp:
         x, y = self.root.winfo_pointerxy(); widget = self.root.winfo_containing(x, y)
         if widget is canvas or str(widget).startswith(str(canvas)): canvas.yview_scroll(int(-1*(event.delta/120)), "units")
     def populate_command_panel(self):
-        commands = { "Click": [('click_location', 'Click at a specific coordinate', 'click_location 100 200'), ('click_text', 'Find and click on visible text', 'click_text "Login"'), ('click_image', 'Find and click an image on screen', 'click_image "images/button.png"')], "Double-Click": [('double_click_location', 'Double-click at a coordinate', 'double_click_location 100 200'), ('double_click_text', 'Find and double-click text', 'double_click_text "My Computer"'), ('double_click_image', 'Find and double-click an image', 'double_click_image "images/icon.png"')], "Other Mouse": [('right_click_location', 'Right-click at a coordinate', 'right_click_location 100 200'), ('move_to', 'Move the mouse without clicking', 'move_to 500 500'), ('click_and_drag', 'Drag mouse from start to end point', 'click_and_drag 100 100 500 500 1.5'), ('scroll', 'Scroll the mouse wheel', 'scroll -10')], "Variables & Logic": [('var', 'Assign a value to a variable', 'var my_var 10'), ('eval', 'Perform math and assign', 'eval result = $my_var * 2'), ('if_eval', 'Check a condition using variables', 'if_eval $result > 15')], "Conditional (IF)": [('if_pixel_matches', 'IF a pixel matches a color', 'if_pixel_matches 100 200 255 0 0 10'), ('if_text_region', 'IF text is in a region', 'if_text_region "Success" 100 100 300 200'), ('if_text_screen', 'IF text is on screen', 'if_text_screen "Welcome"'), ('if_image_screen', 'IF image is on screen', 'if_image_screen "ok.png"'), ('if_not_image_screen', 'IF NOT image is on screen', 'if_not_image_screen "error.png"'), ('else', 'ELSE block for a preceding IF', 'else'), ('endif', 'Marks the end of an IF/ELSE block', 'endif')], "Loops & Control Flow": [('loop', 'Repeat a block of code N times', 'loop 5'), ('endloop', 'Marks the end of a LOOP block', 'endloop'), ('break', 'Exit the current loop', 'break'), ('exit', 'Terminate the entire script', 'exit')], "Data & Text": [('get_text_region', 'Get text from a region into a variable', 'get_text_region my_variable 10 20 30 40'), ('mouse_pos', 'Get mouse coords into variables', 'mouse_pos x_coord y_coord')], "System & Media": [('sound', 'Play a sound file (.wav, .mp3)', 'sound "path/to/alert.mp3"'), ('screenshot', 'Save a screenshot to a file', 'screenshot "capture.png" 10 20 30 40')], "Flow & Logging": [('script', 'Run another script file', 'script "path/to/sub.txt"'), ('playback', 'Playback a recorded macro', 'playback "login.json"'), ('popup', 'Show a message box to the user', 'popup "Task Complete!"'), ('log', 'Write a message to the output console', 'log "Starting Step 2..."')], "Timing": [('wait', 'Pause the script for seconds', 'wait 2.5'), ('delay', 'Alias for wait', 'delay 1')], "Window & Keyboard": [('select_window', 'Bring a window to the foreground', 'select_window "Notepad"'), ('key', 'Press a special keyboard key', 'key enter'), ('type', 'Type a string of text', 'type "Hello, World!"')] }
+        commands = { "Click": [('click_location', 'Click at a specific coordinate', 'click_location 100 200'), ('click_text', 'Find and click on visible text, optionally only inside x1 y1 x2 y2', 'click_text "Login" 0 0 800 600'), ('click_image', 'Find and click an image on screen, with optional confidence and x1 y1 x2 y2', 'click_image "images/button.png" 0.9 0 0 800 600')], "Double-Click": [('double_click_location', 'Double-click at a coordinate', 'double_click_location 100 200'), ('double_click_text', 'Find and double-click text', 'double_click_text "My Computer"'), ('double_click_image', 'Find and double-click an image', 'double_click_image "images/icon.png"')], "Other Mouse": [('right_click_location', 'Right-click at a coordinate', 'right_click_location 100 200'), ('move_to', 'Move the mouse without clicking', 'move_to 500 500'), ('click_and_drag', 'Drag mouse from start to end point', 'click_and_drag 100 100 500 500 1.5'), ('scroll', 'Scroll the mouse wheel', 'scroll -10')], "Variables & Logic": [('var', 'Assign a value to a variable', 'var my_var 10'), ('eval', 'Perform math and assign', 'eval result = $my_var * 2'), ('if_eval', 'Check a condition using variables', 'if_eval $result > 15')], "Conditional (IF)": [('if_pixel_matches', 'IF a pixel matches a color', 'if_pixel_matches 100 200 255 0 0 10'), ('if_pixels_match', 'IF x,y points (or a $list, or x1 y1 x2 y2) match a color, with tolerance and required fraction; sets $pixels_matched', 'if_pixels_match 10,20 30,20 50,20 0 255 0 10 1.0'), ('if_text_region', 'IF text is in a region', 'if_text_region "Success" 100 100 300 200'), ('if_text_screen', 'IF text is on screen, optionally only inside x1 y1 x2 y2', 'if_text_screen "Welcome" 0 0 800 600'), ('search_region', 'Limit text searches to a region by default (off to clear)', 'search_region 0 0 1920 1080'), ('if_image_screen', 'IF image is on screen, with optional confidence and x1 y1 x2 y2', 'if_image_screen "ok.png" 0.85'), ('if_not_image_screen', 'IF NOT image is on screen', 'if_not_image_screen "error.png"'), ('else', 'ELSE block for a preceding IF', 'else'), ('endif', 'Marks the end of an IF/ELSE block', 'endif')], "Loops & Control Flow": [('loop', 'Repeat a block of code N times', 'loop 5'), ('endloop', 'Marks the end of a LOOP block', 'endloop'), ('foreach', 'Repeat a block once per item of a list variable', 'foreach hit $buttons'), ('endforeach', 'Marks the end of a FOREACH block', 'endforeach'), ('break', 'Exit the current loop', 'break'), ('exit', 'Terminate the entire script', 'exit')], "Data & Text": [('get_text_region', 'Get text from a region into a variable', 'get_text_region my_variable 10 20 30 40'), ('mouse_pos', 'Get mouse coords into variables', 'mouse_pos x_coord y_coord'), ('find_all_images', 'Store every match of an image as a list of points', 'find_all_images buttons "row.png" 0.9'), ('find_all_text', 'Store every occurrence of a word as a list of points', 'find_all_text links "Open" 0 0 800 600'), ('count_color_region', 'Store the fraction of a region (or x,y points) matching a color, with tolerance', 'count_color_region filled 100 500 400 510 0 200 0 10')], "System & Media": [('sound', 'Play a sound file (.wav, .mp3)', 'sound "path/to/alert.mp3"'), ('screenshot', 'Save a screenshot to a file', 'screenshot "capture.png" 10 20 30 40'), ('frame_cache', 'Set the screen capture reuse window (ms) and log hit/miss stats', 'frame_cache 50'), ('ocr_workers', 'Set how many OCR workers keep the language model loaded', 'ocr_workers 4'), ('ocr_tiles', 'OCR large areas as cols x rows tiles in parallel processes (off to disable)', 'ocr_tiles 4 2 8')], "Flow & Logging": [('script', 'Call another script file, optionally with name=value parameters and -> var for its return value', 'script "path/to/sub.txt" count=3 -> total'), ('return', 'Leave the current script, handing a value back to the caller', 'return $count * 2'), ('playback', 'Playback a recorded macro, optionally at 0.5-10x speed and/or skipping idle gaps', 'playback "login.macro" 2 nowait'), ('popup', 'Show a message box to the user', 'popup "Task Complete!"'), ('log', 'Write a message to the output console', 'log "Starting Step 2..."')], "Timing": [('wait', 'Pause the script for seconds', 'wait 2.5'), ('delay', 'Alias for wait', 'delay 1'), ('wait_until_image', 'Wait up to N seconds for an image (wait_until_not_image for it to vanish)', 'wait_until_image 10 "ok.png"'), ('wait_until_text', 'Wait up to N seconds for text (wait_until_not_text for it to vanish)', 'wait_until_text 10 "Ready" 0 0 800 600'), ('wait_until_pixel', 'Wait up to N seconds for a pixel color (wait_until_not_pixel for the opposite)', 'wait_until_pixel 5 100 200 255 0 0 10')], "Window & Keyboard": [('select_window', 'Bring a window to the foreground', 'select_window "Notepad"'), ('key', 'Press a special keyboard key, optionally N times', 'key backspace 3'), ('type', 'Type a string of text', 'type "Hello, World!"')] }
         row = 0
         for category, cmds in commands.items():
             ttk.Label(self.command_panel, text=category, font=("Segoe UI", 10, "bold")).grid(row=row, column=0, sticky="w", pady=(10, 2), padx=5); row += 1
@@ -196,22 +260,46 @@ class AutomationApp:
     def populate_explorer(self, event=None):
         if not self.workspace_dir: return
         for i in self.tree.get_children(): self.tree.delete(i)
+        self.tree_nodes = {os.path.normpath(self.workspace_dir): ""}
         self.root.title(f"Nexus Automation Studio - {os.path.basename(self.workspace_dir)}")
-        def process_directory(parent, path):
-            for p in sorted(os.listdir(path)):
-                abs_path = os.path.join(path, p); is_dir = os.path.isdir(abs_path)
-                node_text = f"📁 {p}" if is_dir else f"📜 {p}"
-                if not is_dir and not (p.endswith('.txt') or p.endswith('.json')): continue
-                node = self.tree.insert(parent, "end", text=node_text, open=False, values=[abs_path])
-                if is_dir: process_directory(node, abs_path)
-        process_directory("", self.workspace_dir)
+        self.workspace_index.open(self.workspace_dir)  # folders are listed lazily, on first expand
+    def on_tree_open(self, event=None):
+        item_id = self.tree.focus(); children = self.tree.get_children(item_id)
+        if len(children) == 1 and self.tree.tag_has("placeholder", children[0]): self.workspace_index.request(self.tree.item(item_id, "values")[0])
+    def insert_tree_node(self, parent, entry, position="end"):
+        node = self.tree.insert(parent, position, text=f"📁 {entry.name}" if entry.is_dir else f"📜 {entry.name}", open=False, values=[entry.path])
+        if entry.is_dir: self.tree.insert(node, "end", text="…", tags=("placeholder",))  # gives the folder an expand arrow until it is listed
+        self.tree_nodes[entry.path] = node
+    def drain_explorer_events(self):
+        events = self.workspace_index.events
+        while not events.empty():
+            kind, folder, *details = events.get()
+            parent = self.tree_nodes.get(folder)
+            if parent is None or (parent and not self.tree.exists(parent)): continue
+            if kind == 'listing':
+                for child in self.tree.get_children(parent): self.forget_tree_node(child)
+                for entry in details[0]: self.insert_tree_node(parent, entry)
+            elif kind == 'added':
+                entry, position = details
+                if entry.path not in self.tree_nodes: self.insert_tree_node(parent, entry, position)
+            elif kind == 'removed':
+                node = self.tree_nodes.get(details[0])
+                if node and self.tree.exists(node): self.forget_tree_node(node)
+        self.root.after(100, self.drain_explorer_events)
+    def forget_tree_node(self, node):
+        values = self.tree.item(node, "values")
+        if values:
+            prefix = values[0] + os.sep
+            for path in [p for p in self.tree_nodes if p == values[0] or p.startswith(prefix)]: del self.tree_nodes[path]
+        self.tree.delete(node)
     def on_tree_double_click(self, event):
         item_id = self.tree.focus();
-        if not item_id: return
+        if not item_id or self.tree.tag_has("placeholder", item_id): return
         file_path = self.tree.item(item_id, "values")[0]
         if os.path.isfile(file_path) and file_path.endswith('.txt'): self.load_script_from_path(file_path)
     def on_tree_right_click(self, event):
         item_id = self.tree.identify_row(event.y)
+        if item_id and self.tree.tag_has("placeholder", item_id): item_id = self.tree.parent(item_id)
         if not item_id: parent_dir = self.workspace_dir
         else: self.tree.selection_set(item_id); path = self.tree.item(item_id, "values")[0]; parent_dir = path if os.path.isdir(path) else os.path.dirname(path)
         menu = tk.Menu(self.root, tearoff=0)
@@ -226,7 +314,7 @@ class AutomationApp:
         file_name = simpledialog.askstring("New Script", "Enter script name (without .txt):", parent=self.root)
         if file_name:
             file_path = os.path.join(parent_dir, f"{file_name}.txt")
-            if not os.path.exists(file_path): open(file_path, 'w').close(); self.populate_explorer()
+            if not os.path.exists(file_path): open(file_path, 'w').close(); self.workspace_index.rescan(parent_dir)
             else: messagebox.showerror("Error", "A file with that name already exists.")
     def create_new_file_from_button(self):
         if self.workspace_dir: self.create_new_file(self.workspace_dir)
@@ -235,26 +323,26 @@ class AutomationApp:
         folder_name = simpledialog.askstring("New Folder", "Enter folder name:", parent=self.root)
         if folder_name:
             folder_path = os.path.join(parent_dir, folder_name)
-            if not os.path.exists(folder_path): os.makedirs(folder_path); self.populate_explorer()
+            if not os.path.exists(folder_path): os.makedirs(folder_path); self.workspace_index.rescan(parent_dir)
             else: messagebox.showerror("Error", "A folder with that name already exists.")
     def rename_tree_item(self, old_path):
         old_name = os.path.basename(old_path)
         new_name = simpledialog.askstring("Rename", "Enter new name:", initialvalue=old_name, parent=self.root)
         if new_name and new_name != old_name:
             new_path = os.path.join(os.path.dirname(old_path), new_name)
-            try: os.rename(old_path, new_path); self.populate_explorer()
+            try: os.rename(old_path, new_path); self.workspace_index.rescan(os.path.dirname(old_path))
             except Exception as e: messagebox.showerror("Error", f"Could not rename: {e}")
     def duplicate_tree_item(self, old_path):
         base, ext = os.path.splitext(old_path)
         new_path = f"{base}_copy{ext}"
-        try: shutil.copy2(old_path, new_path); self.populate_explorer()
+        try: shutil.copy2(old_path, new_path); self.workspace_index.rescan(os.path.dirname(old_path))
         except Exception as e: messagebox.showerror("Error", f"Could not duplicate: {e}")
     def delete_tree_item(self, path):
         if messagebox.askokcancel("Delete", f"Are you sure you want to permanently delete '{os.path.basename(path)}'?"):
             try:
                 if os.path.isdir(path): shutil.rmtree(path)
                 else: os.remove(path)
-                self.populate_explorer()
+                self.workspace_index.rescan(os.path.dirname(path))
             except Exception as e: messagebox.showerror("Error", f"Could not delete: {e}")
 
     # --- SCRIPT EXECUTION & OTHER METHODS ---
@@ -278,8 +366,9 @@ class AutomationApp:
     def quit_app(self):
         self.keybinder.stop()
         if self.is_script_running.is_set():
-            if messagebox.askokcancel("Quit", "A script is running. Quit anyway?"): self.stop_script_event(); self.root.destroy()
-        else: self.root.destroy()
+            if not messagebox.askokcancel("Quit", "A script is running. Quit anyway?"): return
+            self.stop_script_event()
+        self.console.stop(); self.log_listener.stop(); self.workspace_index.close(); self.root.destroy()
     
     # --- THIS FUNCTION IS FIXED ---
     def insert_command(self, command_id):
@@ -303,7 +392,7 @@ class AutomationApp:
             file_path = filedialog.askopenfilename(title="Select Script File", filetypes=[("Text files", "*.txt")])
             if file_path: self.editor.insert(tk.INSERT, f"script \"{file_path}\"\n")
         elif command_id == 'playback':
-            file_path = filedialog.askopenfilename(title="Select Macro File", filetypes=[("Macro files", "*.json")])
+            file_path = filedialog.askopenfilename(title="Select Macro File", filetypes=[("Macro files", "*.macro *.json")])
             if file_path: self.editor.insert(tk.INSERT, f"playback \"{file_path}\"\n")
         elif command_id == 'sound':
             file_path = filedialog.askopenfilename(title="Select Sound File", filetypes=[("Sound Files", "*.mp3 *.wav")])
@@ -312,11 +401,14 @@ class AutomationApp:
             self.selection_mode = 'region'
             self.status_var.set("Drag a region to capture (Esc for fullscreen)"); self.root.iconify(); 
             RegionSelectorOverlay(self.root, self.finalize_screenshot_selection)
+        elif command_id in ['if_pixels_match', 'count_color_region']:
+            self.selection_mode = 'region'; self.status_var.set("Drag a region to check; its center sets the color (Esc to cancel)"); self.root.iconify()
+            RegionSelectorOverlay(self.root, self.finalize_color_region)
         elif command_id == 'if_pixel_matches':
             self.selection_mode = 'point'; self.status_var.set(f"Click a point on screen to sample pixel color (Esc to cancel)"); self.root.iconify(); 
             PointSelectorOverlay(self.root, self.finalize_pixel_selection)
         else:
-            line_content_map = {'endloop': 'endloop\n', 'endif': 'endif\n', 'break': 'break\n', 'else': 'else\n', 'exit': 'exit\n', 'mouse_pos': 'mouse_pos x_var y_var\n'}
+            line_content_map = {'endloop': 'endloop\n', 'endforeach': 'endforeach\n', 'endif': 'endif\n', 'break': 'break\n', 'else': 'else\n', 'exit': 'exit\n', 'mouse_pos': 'mouse_pos x_var y_var\n'}
             line_content = line_content_map.get(command_id, f"{command_id} ")
             self.editor.insert(tk.INSERT, line_content); self.status_var.set(f"Inserted {command_id}. Fill in parameters.")
 
@@ -361,6 +453,14 @@ class AutomationApp:
         else:
             self.status_var.set("Screenshot cancelled.")
         self.cancel_selection()
+    def finalize_color_region(self, region):
+        if region:
+            x1, y1, x2, y2 = region; prefix = f"{self.current_command} match" if self.current_command == 'count_color_region' else self.current_command
+            try: r, g, b = pyautogui.pixel((x1 + x2) // 2, (y1 + y2) // 2)[:3]
+            except Exception: r, g, b = 0, 0, 0
+            self.editor.insert(tk.INSERT, f"{prefix} {x1} {y1} {x2} {y2} {r} {g} {b} 10\n"); self.status_var.set(f"Region captured for {self.current_command}.")
+        else: self.status_var.set("Region selection cancelled.")
+        self.cancel_selection()
     def finalize_pixel_selection(self, coords):
         if coords:
             x, y = coords
@@ -378,15 +478,15 @@ class AutomationApp:
         self.stop_pynput_listener();
         if self.selection_mode: self.root.deiconify()
         self.selection_mode = None; self.current_command = None; self.drag_start_pos = None; self.status_var.set("Ready")
-    def update_output(self, message):
-        def _update(): self.output.config(state='normal'); self.output.insert(tk.END, message + '\n'); self.output.see(tk.END); self.output.config(state='disabled'); self.logger.info(message)
-        if self.root: self.root.after(0, _update)
+    def update_output(self, message): self.console.push(message); self.logger.info(message)
     def update_status(self, status):
         if self.root: self.root.after(0, lambda: self.status_var.set(status))
     def start_script_event(self, event=None):
         if self.is_script_running.is_set(): messagebox.showwarning("Busy", "A script is already running."); return
         script = self.editor.get("1.0", "end-1c");
         if not script: messagebox.showinfo("Empty Script", "The script is empty."); return
+        self.engine.profile_export_path = os.path.join(self.workspace_dir or os.getcwd(), 'script_profile')
+        self.engine.record_path = os.path.join(self.workspace_dir or os.getcwd(), 'runs', time.strftime('run_%Y%m%d_%H%M%S.nxrun')) if self.record_run_var.get() else None
         self.root.iconify()
         self.is_script_running.set()
         thread = threading.Thread(target=self.run_script_in_thread, args=(script,), daemon=True); thread.start()
@@ -407,30 +507,32 @@ class AutomationApp:
             self.status_var.set(f"🔴 Macro Recording... Press {stop_key.upper()} to stop.")
             self.root.iconify()
         else:
-            self.is_recording = False; events = self.recorder.stop_recording()
+            self.is_recording = False; recording = self.recorder.stop_recording()
             self.root.deiconify()
             self.status_var.set("Macro recording stopped.")
-            self.process_recorded_macro(events)
-    def process_recorded_macro(self, events):
-        if not events: messagebox.showinfo("Macro Recorder", "No actions were recorded."); return
-        save_type = messagebox.askyesnocancel("Save Macro", "Macro recording finished.\n\nYes = Save to a .json file (for playback)\nNo = Insert commands directly into script")
+            self.process_recorded_macro(recording)
+    def process_recorded_macro(self, recording):
+        if not recording: messagebox.showinfo("Macro Recorder", "No actions were recorded."); return
+        try: self.save_recorded_macro(recording)
+        finally:
+            if os.path.exists(recording): os.remove(recording)
+    def save_recorded_macro(self, recording):
+        save_type = messagebox.askyesnocancel("Save Macro", "Macro recording finished.\n\nYes = Save to a macro file (for playback)\nNo = Insert commands directly into script")
         if save_type is None: return
         if save_type:
-            file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+            file_path = filedialog.asksaveasfilename(defaultextension=".macro", filetypes=[("Macro files", "*.macro"), ("JSON files", "*.json")])
             if file_path:
-                with open(file_path, 'w') as f: json.dump(events, f, indent=4)
+                if file_path.lower().endswith('.json'): export_json(recording, file_path)
+                else: shutil.move(recording, file_path)
                 messagebox.showinfo("Success", f"Macro saved to {os.path.basename(file_path)}"); self.editor.insert(tk.INSERT, f'# Play back recorded macro\nplayback "{file_path}"\n')
         else:
-            script_text = "\n# --- Start of recorded macro ---\n"
-            for event in events:
-                if event['type'] == 'wait': script_text += f"wait {event['duration']}\n"
-                elif event['type'] in ['click_location', 'double_click_location', 'right_click_location']: script_text += f"{event['type']} {event['x']} {event['y']}\n"
-                elif event['type'] == 'type': script_text += f"type \"{event['text']}\"\n"
-                elif event['type'] == 'key': script_text += f"key {event['key_name']}\n"
-            script_text += "# --- End of recorded macro ---\n"
+            lines, report = optimize_events(read_macro(recording))
+            script_text = "\n# --- Start of recorded macro ---\n" + ''.join(line + "\n" for line in lines) + "# --- End of recorded macro ---\n"
+            self.update_output(report.summary()); self.status_var.set(report.summary())
             self.editor.insert(tk.INSERT, script_text)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # tiled OCR worker processes in the frozen .exe
     root = tk.Tk()
     file_to_open = sys.argv[1] if len(sys.argv) > 1 else None
     app = AutomationApp(root, file_to_open=file_to_open)
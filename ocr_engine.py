@@ -0,0 +1,252 @@
+import ctypes
+import ctypes.util
+import glob
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytesseract
+
+OCR_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+TSV_HEADER = ['level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num', 'left', 'top', 'width', 'height', 'conf', 'text']
+PSM_AUTO = 3  # the tesseract CLI default; the C API would otherwise use PSM_SINGLE_BLOCK
+DEFAULT_DPI = 70  # what the CLI assumes for in-memory images without resolution info
+TILE_OVERLAP = 120  # pixels shared by neighbouring tiles; wider than most words so each word is whole in some tile
+MIN_TILED_AREA = 800 * 600  # smaller images are faster to OCR in one piece
+SEAM_MARGIN = 2
+
+class OcrCache:
+    """LRU cache of OCR results keyed by an exact hash of the region pixels plus the OCR parameters."""
+    def __init__(self, max_entries=64, ttl=60.0):
+        self.max_entries = max_entries; self.ttl = ttl
+        self.entries = OrderedDict(); self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0
+
+    @staticmethod
+    def make_key(image, kind, **params):
+        pixels = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(pixels.data, digest_size=16).hexdigest()
+        return (kind, pixels.shape, digest, tuple(sorted(params.items())))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None: self.misses += 1; return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl: del self.entries[key]; self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1; return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value); self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+
+    def get_or_compute(self, image, kind, compute, **params):
+        key = self.make_key(image, kind, **params)
+        value = self.get(key)
+        if value is None: value = compute(image, **params); self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock: self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0, 'entries': len(self.entries)}
+
+def tsv_to_dict(tsv):
+    """Parse Tesseract TSV rows into the same layout as pytesseract.Output.DICT."""
+    data = {head: [] for head in TSV_HEADER}; text_col = len(TSV_HEADER) - 1
+    for row in tsv.split('\n'):
+        if not row or row.startswith('level'): continue
+        cells = row.split('\t')
+        if len(cells) < text_col: continue
+        if len(cells) == text_col: cells.append('')
+        for i, head in enumerate(TSV_HEADER):
+            data[head].append(cells[i] if i == text_col else int(float(cells[i])))
+    return data
+
+def _as_pixel_buffer(image):
+    pixels = np.asarray(image)
+    if pixels.dtype != np.uint8: pixels = pixels.astype(np.uint8)
+    bytes_per_pixel = 1 if pixels.ndim == 2 else pixels.shape[2]
+    # Crops of a cached frame keep their parent's row stride, which Tesseract accepts as bytes_per_line
+    if pixels.strides[-1] != 1 or (pixels.ndim == 3 and pixels.strides[1] != bytes_per_pixel): pixels = np.ascontiguousarray(pixels)
+    return pixels, bytes_per_pixel
+
+class PytesseractBackend:
+    """Fallback backend: one tesseract process per call through pytesseract."""
+    name = 'pytesseract'
+    def image_to_data(self, image): return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    def image_to_string(self, image): return pytesseract.image_to_string(image)
+    def resize(self, workers): pass
+    def close(self): pass
+
+class TesseractApiPool:
+    """Pool of long-lived libtesseract handles that keep the language model loaded and read images from memory."""
+    name = 'libtesseract'
+    def __init__(self, library_path, tessdata_dir, lang='eng', workers=OCR_WORKERS):
+        self.lib = ctypes.CDLL(library_path); self._bind()
+        self.tessdata_dir = tessdata_dir; self.lang = lang; self.workers = max(1, workers)
+        self.idle = queue.LifoQueue(); self.created = 0; self.lock = threading.Lock()
+        self.idle.put(self._create_handle())  # fail fast if the model cannot be loaded
+
+    def _bind(self):
+        lib = self.lib; handle = ctypes.c_void_p
+        lib.TessBaseAPICreate.restype = handle
+        lib.TessBaseAPIInit3.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p]; lib.TessBaseAPIInit3.restype = ctypes.c_int
+        lib.TessBaseAPISetPageSegMode.argtypes = [handle, ctypes.c_int]
+        lib.TessBaseAPISetImage.argtypes = [handle, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.TessBaseAPISetSourceResolution.argtypes = [handle, ctypes.c_int]
+        lib.TessBaseAPIGetUTF8Text.argtypes = [handle]; lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+        lib.TessBaseAPIGetTsvText.argtypes = [handle, ctypes.c_int]; lib.TessBaseAPIGetTsvText.restype = ctypes.c_void_p
+        lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+        for name in ('TessBaseAPIClear', 'TessBaseAPIEnd', 'TessBaseAPIDelete'): getattr(lib, name).argtypes = [handle]
+
+    def _create_handle(self):
+        api = self.lib.TessBaseAPICreate()
+        datapath = self.tessdata_dir.encode('utf-8') if self.tessdata_dir else None
+        if self.lib.TessBaseAPIInit3(api, datapath, self.lang.encode('utf-8')) != 0:
+            self.lib.TessBaseAPIDelete(api); raise RuntimeError(f"Could not load '{self.lang}' from {self.tessdata_dir}")
+        self.lib.TessBaseAPISetPageSegMode(api, PSM_AUTO); self.created += 1
+        return api
+
+    def _acquire(self):
+        try: return self.idle.get_nowait()
+        except queue.Empty: pass
+        with self.lock:
+            if self.created < self.workers: return self._create_handle()
+        return self.idle.get()
+
+    def _release(self, api):
+        with self.lock:
+            if self.created > self.workers: self._destroy(api); return
+        self.idle.put(api)
+
+    def _destroy(self, api): self.lib.TessBaseAPIEnd(api); self.lib.TessBaseAPIDelete(api); self.created -= 1
+
+    def _recognize(self, image, get_text):
+        pixels, bytes_per_pixel = _as_pixel_buffer(image); height, width = pixels.shape[:2]
+        if not width or not height: return ''
+        api = self._acquire()
+        try:
+            self.lib.TessBaseAPISetImage(api, pixels.ctypes.data, width, height, bytes_per_pixel, pixels.strides[0])
+            self.lib.TessBaseAPISetSourceResolution(api, DEFAULT_DPI)
+            text_ptr = get_text(api)
+            if not text_ptr: raise RuntimeError("Tesseract returned no result")
+            try: return ctypes.string_at(text_ptr).decode('utf-8', errors='replace')
+            finally: self.lib.TessDeleteText(text_ptr)
+        finally: self.lib.TessBaseAPIClear(api); self._release(api)
+
+    def image_to_string(self, image): return self._recognize(image, self.lib.TessBaseAPIGetUTF8Text)
+    def image_to_data(self, image): return tsv_to_dict(self._recognize(image, lambda api: self.lib.TessBaseAPIGetTsvText(api, 0)))
+
+    def resize(self, workers):
+        with self.lock: self.workers = max(1, workers)
+        while self.created > self.workers:
+            try: api = self.idle.get_nowait()
+            except queue.Empty: break
+            with self.lock: self._destroy(api)
+
+    def close(self):
+        while True:
+            try: api = self.idle.get_nowait()
+            except queue.Empty: break
+            self._destroy(api)
+
+def find_tesseract_libraries(tesseract_dir):
+    candidates = sorted(glob.glob(os.path.join(tesseract_dir, 'libtesseract*.dll'))) if tesseract_dir else []
+    system_lib = ctypes.util.find_library('tesseract')
+    if system_lib: candidates.append(system_lib)
+    return candidates
+
+def create_ocr_backend(tesseract_dir=None, workers=OCR_WORKERS, lang='eng'):
+    """Prefer the in-process libtesseract pool; fall back to pytesseract if the library or model is unavailable."""
+    bundled_tessdata = os.path.join(tesseract_dir, 'tessdata') if tesseract_dir else ''
+    tessdata_dir = bundled_tessdata if os.path.isdir(bundled_tessdata) else os.environ.get('TESSDATA_PREFIX', '')
+    if tesseract_dir and os.path.isdir(tesseract_dir) and hasattr(os, 'add_dll_directory'): os.add_dll_directory(os.path.abspath(tesseract_dir))
+    for library_path in find_tesseract_libraries(tesseract_dir):
+        try: return TesseractApiPool(library_path, tessdata_dir, lang, workers)
+        except (OSError, AttributeError, RuntimeError): continue
+    return PytesseractBackend()
+
+_shared_backend = None; _shared_backend_lock = threading.Lock()
+
+def get_ocr_backend(tesseract_dir=None, workers=None):
+    """Return the process-wide OCR backend so every engine shares the loaded model."""
+    global _shared_backend
+    with _shared_backend_lock:
+        if _shared_backend is None: _shared_backend = create_ocr_backend(tesseract_dir, workers or OCR_WORKERS)
+        elif workers: _shared_backend.resize(workers)
+        return _shared_backend
+
+def tile_grid(width, height, cols, rows, overlap=TILE_OVERLAP):
+    """Return (x0, y0, x1, y1) for a cols x rows grid whose tiles extend `overlap` pixels into their neighbours."""
+    step_x = -(-width // cols); step_y = -(-height // rows)
+    return [(max(0, c * step_x - overlap), max(0, r * step_y - overlap), min(width, (c + 1) * step_x + overlap), min(height, (r + 1) * step_y + overlap))
+            for r in range(rows) for c in range(cols)]
+
+_tile_backend = None
+
+def _init_tile_worker(tesseract_dir, tesseract_cmd):
+    global _tile_backend
+    if tesseract_cmd: pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    _tile_backend = create_ocr_backend(tesseract_dir, workers=1)
+
+def _ocr_tile(tile):
+    data = _tile_backend.image_to_data(tile)
+    return [tuple(data[key][i] for key in TSV_HEADER) for i in range(len(data['text'])) if data['level'][i] == 5 and data['text'][i].strip()]
+
+_tile_pools = {}; _tile_pools_lock = threading.Lock()
+
+def get_tile_pool(workers, tesseract_dir=None):
+    key = (workers, tesseract_dir)
+    with _tile_pools_lock:
+        if key not in _tile_pools:
+            _tile_pools[key] = ProcessPoolExecutor(max_workers=workers, initializer=_init_tile_worker, initargs=(tesseract_dir, pytesseract.pytesseract.tesseract_cmd))
+        return _tile_pools[key]
+
+class TiledOcr:
+    """OCR a large image as overlapping tiles in a process pool and merge the words back into one Output.DICT."""
+    name = 'tiled'
+    def __init__(self, cols=2, rows=2, workers=None, tesseract_dir=None, overlap=TILE_OVERLAP):
+        self.cols = max(1, cols); self.rows = max(1, rows); self.overlap = overlap
+        self.workers = workers or min(self.cols * self.rows, os.cpu_count() or 1); self.tesseract_dir = tesseract_dir
+
+    def params(self): return {'cols': self.cols, 'rows': self.rows, 'overlap': self.overlap}
+
+    def image_to_data(self, image):
+        pixels = np.asarray(image); height, width = pixels.shape[:2]
+        tiles = tile_grid(width, height, self.cols, self.rows, self.overlap)
+        results = get_tile_pool(self.workers, self.tesseract_dir).map(_ocr_tile, [np.ascontiguousarray(pixels[y0:y1, x0:x1]) for x0, y0, x1, y1 in tiles])
+        return merge_tile_words(tiles, list(results), width, height)
+
+def merge_tile_words(tiles, tile_words, width, height):
+    """Shift tile words to image coordinates, drop words clipped by an interior seam and de-duplicate the overlaps."""
+    whole, clipped = [], []
+    for tile_index, ((x0, y0, x1, y1), words) in enumerate(zip(tiles, tile_words)):
+        for word in words:
+            row = dict(zip(TSV_HEADER, word)); left, top = row['left'] + x0, row['top'] + y0; right, bottom = left + row['width'], top + row['height']
+            row.update(left=left, top=top, block_num=tile_index * 1000 + row['block_num'])  # keep line grouping unique per tile
+            on_seam = (x0 > 0 and left - x0 <= SEAM_MARGIN) or (y0 > 0 and top - y0 <= SEAM_MARGIN) or (x1 < width and x1 - right <= SEAM_MARGIN) or (y1 < height and y1 - bottom <= SEAM_MARGIN)
+            (clipped if on_seam else whole).append(row)
+    kept = []; by_text = {}
+    for row in sorted(whole, key=lambda r: -float(r['conf'])):
+        same = by_text.setdefault(row['text'].strip().lower(), [])
+        if any(_overlap_ratio(row, other) > 0.3 for other in same): continue
+        same.append(row); kept.append(row)
+    # A word wider than the overlap is clipped in every tile; keep its pieces rather than lose it
+    for row in clipped:
+        if not any(_overlap_ratio(row, other) > 0 for other in kept): kept.append(row)
+    kept.sort(key=lambda r: (r['block_num'], r['par_num'], r['line_num'], r['word_num']))
+    return {key: [row[key] for row in kept] for key in TSV_HEADER}
+
+def _overlap_ratio(a, b):
+    inter_w = min(a['left'] + a['width'], b['left'] + b['width']) - max(a['left'], b['left'])
+    inter_h = min(a['top'] + a['height'], b['top'] + b['height']) - max(a['top'], b['top'])
+    if inter_w <= 0 or inter_h <= 0: return 0.0
+    return inter_w * inter_h / float(min(a['width'] * a['height'], b['width'] * b['height']) or 1)
@@ -0,0 +1,95 @@
+import csv
+import json
+import os
+import time
+
+CATEGORIES = ('capture', 'ocr', 'match', 'input')
+# (attribute owner, attribute name, category); owners are resolved against the engine being profiled
+TIMED_CALLS = [('frame_cache', '_capture', 'capture'), (None, 'ocr_data', 'ocr'), (None, 'ocr_string', 'ocr'),
+               (None, 'find_text_location', 'match'), (None, 'find_all_text_locations', 'match'), (None, 'pixel_matches', 'match'),
+               (None, 'color_match_fraction', 'match'), ('image_matcher', 'find', 'match'), ('image_matcher', 'find_all', 'match'), (None, '_input', 'input')]
+
+class LineStats:
+    __slots__ = ('line_num', 'command', 'text', 'script', 'calls', 'total') + CATEGORIES
+    def __init__(self, op, script=None):
+        self.line_num = op.line_num; self.command = op.command; self.text = op.text; self.script = script
+        self.calls = 0; self.total = 0.0
+        for category in CATEGORIES: setattr(self, category, 0.0)
+
+    def as_dict(self):
+        row = {'script': self.script or '', 'line': self.line_num + 1, 'command': self.command, 'text': self.text, 'calls': self.calls, 'total_s': self.total, 'avg_ms': self.total / self.calls * 1000 if self.calls else 0.0}
+        row.update({f"{category}_s": getattr(self, category) for category in CATEGORIES})
+        row['other_s'] = max(self.total - sum(getattr(self, c) for c in CATEGORIES), 0.0)
+        return row
+
+class ScriptProfiler:
+    """Per-line wall time and capture/OCR/match/input split for one run_script call.
+
+    Time is charged to a line from the moment it starts until the next instruction starts. The timed
+    calls are wrapped on the engine instance only while profiling, so a normal run pays nothing for them."""
+    def __init__(self):
+        self.lines = {}; self.current = None; self.last_time = None; self.script = None  # the sub-script being run, if any
+        self.started = time.perf_counter(); self.elapsed = 0.0
+        self.phase_stack = []; self._patched = []
+
+    def step(self, op):
+        now = time.perf_counter()
+        if self.current is not None: self.current.total += now - self.last_time
+        stats = self.lines.get(op)  # keyed by instruction, so sub-script lines are not merged with the caller's
+        if stats is None: stats = self.lines[op] = LineStats(op, self.script)
+        stats.calls += 1; self.current = stats; self.last_time = now
+
+    def finish(self):
+        now = time.perf_counter()
+        if self.current is not None: self.current.total += now - self.last_time; self.current = None
+        self.elapsed = now - self.started
+
+    def timed(self, category, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter(); self.phase_stack.append(0.0)
+            try: return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start; nested = self.phase_stack.pop()
+                if self.phase_stack: self.phase_stack[-1] += elapsed
+                if self.current is not None: setattr(self.current, category, getattr(self.current, category) + elapsed - nested)
+        return wrapper
+
+    def attach(self, engine):
+        for owner_name, attr, category in TIMED_CALLS:
+            owner = getattr(engine, owner_name) if owner_name else engine
+            setattr(owner, attr, self.timed(category, getattr(owner, attr))); self._patched.append((owner, attr))
+
+    def detach(self, engine):
+        for owner, attr in self._patched: delattr(owner, attr)
+        self._patched = []
+
+    def rows(self): return sorted((s.as_dict() for s in self.lines.values()), key=lambda row: row['total_s'], reverse=True)
+
+    def command_totals(self):
+        totals = {}
+        for stats in self.lines.values():
+            entry = totals.setdefault(stats.command, {'calls': 0, 'total_s': 0.0, **{f"{c}_s": 0.0 for c in CATEGORIES}})
+            entry['calls'] += stats.calls; entry['total_s'] += stats.total
+            for category in CATEGORIES: entry[f"{category}_s"] += getattr(stats, category)
+        return dict(sorted(totals.items(), key=lambda item: item[1]['total_s'], reverse=True))
+
+    def report(self, top=10):
+        lines = [f"--- Profile: {self.elapsed:.3f}s total, hottest lines ---"]
+        for row in self.rows()[:top]:
+            split = ' '.join(f"{c} {row[f'{c}_s'] * 1000:.0f}ms" for c in CATEGORIES if row[f'{c}_s'] >= 0.0005)
+            share = row['total_s'] / self.elapsed * 100 if self.elapsed else 0.0
+            where = f"{os.path.basename(row['script'])}:{row['line']}" if row['script'] else f"line {row['line']:>4}"
+            lines.append(f"{where} {row['total_s'] * 1000:9.1f}ms {share:5.1f}%  x{row['calls']:<6} {row['text'][:50]}" + (f"  [{split}]" if split else ''))
+        lines.append("--- By command ---")
+        for command, entry in list(self.command_totals().items())[:top]:
+            lines.append(f"{command:<24} {entry['total_s'] * 1000:9.1f}ms  x{entry['calls']}")
+        return lines
+
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed_s': self.elapsed, 'lines': self.rows(), 'commands': self.command_totals()}, f, indent=4)
+
+    def export_csv(self, path):
+        rows = self.rows()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['line']); writer.writeheader(); writer.writerows(rows)
@@ -0,0 +1,195 @@
+"""Records the screen frames a script run captured into one .nxrun file, and reads them back with random access.
+
+Usage: python run_recorder.py RUN.nxrun [--export DIR] [--frame N]
+
+Each frame is stored either as a zlib-compressed keyframe or as the tiles that changed since the previous frame, XORed
+against it so unchanged pixels inside a tile compress to nothing. Frames carry their time and the script line that
+captured them; an index at the end of the file maps frame numbers to offsets, so seeking decodes at most one keyframe
+interval. Export writes PNGs plus timestamps.txt, which screen_backend.ReplayScreen replays directly.
+"""
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+MAGIC = b'NXRUN\x00\x00\x01'
+FOOTER_MAGIC = b'NXRUNIDX'
+KEYFRAME, DELTA = 1, 2  # 0 marks the unwritten tail of a file that was never closed
+FRAME_HEADER = struct.Struct('<BdiHHBII')  # kind, seconds, script line, height, width, channels, changed tiles, payload bytes
+FOOTER = struct.Struct('<QI8s')  # index offset, frame count, magic
+TILE = 32
+KEYFRAME_INTERVAL = 100  # bounds how many deltas a seek has to apply
+KEYFRAME_CHANGE = 0.5  # a frame with more than this fraction of tiles changed is stored whole
+COMPRESS_LEVEL = 1
+QUEUE_FRAMES = 8  # frames waiting for the writer thread; further captures are dropped rather than stalling the script
+INITIAL_SIZE = 16 << 20
+
+def tile_view(buffer, tile):
+    """A (rows, cols, tile, tile * channels) view of a buffer whose sides are whole tiles."""
+    height, width, channels = buffer.shape
+    return buffer.reshape(height // tile, tile, width // tile, tile * channels).transpose(0, 2, 1, 3)
+
+class TileGrid:
+    """A frame padded out to whole tiles, so it can be viewed tile by tile without copying."""
+    def __init__(self, shape, tile=TILE):
+        height, width, channels = shape; self.shape = shape; self.tile = tile
+        self.rows, self.cols = -(-height // tile), -(-width // tile)
+        self.buffer = np.zeros((self.rows * tile, self.cols * tile, channels), np.uint8); self.tiles = tile_view(self.buffer, tile)
+
+    def frame(self): return self.buffer[:self.shape[0], :self.shape[1]]
+
+class RunRecorder:
+    """Appends frames to a memory-mapped .nxrun file from a writer thread, so add() costs the capture path a queue put.
+
+    When the writer falls behind, new frames are dropped (drop=True, for live runs) or add() waits for it (replays)."""
+    def __init__(self, path, meta=None, clock=time.monotonic, drop=True):
+        self.path = path; self.clock = clock; self.started = clock(); self.drop = drop
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        header = json.dumps(dict(meta or {}, recorded=time.time(), tile=TILE)).encode('utf-8')
+        self.file = open(path, 'w+b'); self.file.truncate(INITIAL_SIZE); self.map = mmap.mmap(self.file.fileno(), INITIAL_SIZE)
+        self.size = 0; self._append(MAGIC + struct.pack('<I', len(header)) + header)
+        self.offsets = []; self.timestamps = []; self.lines = []; self.kinds = []
+        self.previous = None; self.current = None; self.since_keyframe = 0
+        self.dropped = 0; self.bytes_raw = 0; self.error = None
+        self.queue = queue.Queue(QUEUE_FRAMES); self.thread = threading.Thread(target=self._drain, daemon=True); self.thread.start()
+
+    def add(self, frame, line=0):
+        """Queue a captured frame (it must not be modified afterwards; captures are fresh arrays) tagged with its script line."""
+        try: self.queue.put((frame, self.clock() - self.started, line), block=not self.drop)
+        except queue.Full: self.dropped += 1
+
+    def _append(self, data):
+        end = self.size + len(data)
+        if end > len(self.map): self.map.resize(max(end, len(self.map) * 2))
+        self.map[self.size:end] = data; self.size = end
+
+    def _drain(self):
+        while True:
+            item = self.queue.get()
+            if item is None: return
+            try: self._write(*item)
+            except Exception as e: self.dropped += 1; self.error = e  # keep draining so close() never blocks on a full queue
+
+    def _write(self, frame, seconds, line):
+        frame = np.asarray(frame)
+        if frame.ndim == 2: frame = frame[:, :, None]
+        if frame.dtype != np.uint8: frame = frame.astype(np.uint8)
+        if self.current is None or self.current.shape != frame.shape:  # first frame, or the resolution changed
+            self.previous = TileGrid(frame.shape); self.current = TileGrid(frame.shape); self.since_keyframe = KEYFRAME_INTERVAL
+        self.previous, self.current = self.current, self.previous
+        self.current.frame()[:] = frame; self.bytes_raw += frame.nbytes
+        diff = tile_view(self.current.buffer ^ self.previous.buffer, TILE)
+        changed = np.flatnonzero(diff.any(axis=(2, 3)))
+        height, width, channels = frame.shape
+        if self.since_keyframe >= KEYFRAME_INTERVAL or len(changed) > KEYFRAME_CHANGE * self.current.rows * self.current.cols:
+            kind = KEYFRAME; tiles = 0; payload = zlib.compress(np.ascontiguousarray(frame).tobytes(), COMPRESS_LEVEL); self.since_keyframe = 0
+        else:
+            kind = DELTA; tiles = len(changed); self.since_keyframe += 1
+            rows, cols = np.divmod(changed, self.current.cols)
+            payload = changed.astype('<u4').tobytes() + (zlib.compress(diff[rows, cols].tobytes(), COMPRESS_LEVEL) if tiles else b'')
+        self.offsets.append(self.size); self.timestamps.append(seconds); self.lines.append(line); self.kinds.append(kind)
+        self._append(FRAME_HEADER.pack(kind, seconds, line, height, width, channels, tiles, len(payload)) + payload)
+
+    def close(self):
+        """Finish writing, append the seek index and trim the file; returns the number of frames recorded."""
+        self.queue.put(None); self.thread.join()
+        index_offset = self.size; count = len(self.offsets)
+        self._append(np.array(self.offsets, '<u8').tobytes() + np.array(self.timestamps, '<f8').tobytes() + np.array(self.lines, '<i4').tobytes() + np.array(self.kinds, 'u1').tobytes())
+        self._append(FOOTER.pack(index_offset, count, FOOTER_MAGIC))
+        self.map.flush(); self.map.close(); self.file.truncate(self.size); self.file.close()
+        return count
+
+    def summary(self):
+        ratio = self.bytes_raw / self.size if self.size else 0.0
+        return (f"Run recording: {len(self.offsets)} frames, {self.size / 1024:.0f} KiB ({ratio:.0f}x smaller than raw)"
+                + (f", {self.dropped} dropped" if self.dropped else '') + (f" (last error: {self.error})" if self.error else '') + f" -> {self.path}")
+
+class RunRecording:
+    """Random access to the frames of an .nxrun file. Also a ReplayScreen frame source (len, timestamps, load)."""
+    def __init__(self, path):
+        self.file = open(path, 'rb'); self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC: raise ValueError(f"'{path}' is not a run recording")
+        meta_length, = struct.unpack_from('<I', self.map, len(MAGIC)); start = len(MAGIC) + 4
+        self.meta = json.loads(self.map[start:start + meta_length]); self.tile = self.meta.get('tile', TILE)
+        offset, count, magic = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size) if len(self.map) >= FOOTER.size else (0, 0, b'')
+        if magic == FOOTER_MAGIC:
+            self.offsets = np.frombuffer(self.map, '<u8', count, offset); offset += 8 * count
+            self.timestamps = np.frombuffer(self.map, '<f8', count, offset); offset += 8 * count
+            self.lines = np.frombuffer(self.map, '<i4', count, offset); offset += 4 * count
+            self.kinds = np.frombuffer(self.map, 'u1', count, offset)
+        else: self._scan(start + meta_length)  # never closed (crash or kill): rebuild the index from the frame headers
+        self.keyframes = np.flatnonzero(self.kinds == KEYFRAME); self._grid = None; self._position = None
+
+    def _scan(self, offset):
+        offsets, timestamps, lines, kinds = [], [], [], []
+        while offset + FRAME_HEADER.size <= len(self.map):
+            kind, seconds, line, _, _, _, _, length = FRAME_HEADER.unpack_from(self.map, offset)
+            if kind not in (KEYFRAME, DELTA) or offset + FRAME_HEADER.size + length > len(self.map): break
+            offsets.append(offset); timestamps.append(seconds); lines.append(line); kinds.append(kind)
+            offset += FRAME_HEADER.size + length
+        self.offsets = np.array(offsets, np.uint64); self.timestamps = np.array(timestamps); self.lines = np.array(lines, np.int32); self.kinds = np.array(kinds, np.uint8)
+
+    def __len__(self): return len(self.offsets)
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def _apply(self, index):
+        offset = int(self.offsets[index])
+        kind, _, _, height, width, channels, tiles, length = FRAME_HEADER.unpack_from(self.map, offset); offset += FRAME_HEADER.size
+        if kind == KEYFRAME:
+            if self._grid is None or self._grid.shape != (height, width, channels): self._grid = TileGrid((height, width, channels), self.tile)
+            self._grid.frame()[:] = np.frombuffer(zlib.decompress(self.map[offset:offset + length]), np.uint8).reshape(height, width, channels)
+        elif tiles:
+            changed = np.frombuffer(self.map, '<u4', tiles, offset)
+            diff = np.frombuffer(zlib.decompress(self.map[offset + 4 * tiles:offset + length]), np.uint8).reshape(tiles, self.tile, -1)
+            rows, cols = np.divmod(changed, self._grid.cols)
+            self._grid.tiles[rows, cols] ^= diff
+        self._position = index
+
+    def frame(self, index):
+        """The RGB frame at index, decoded from the nearest keyframe at or before it (or from the last frame read)."""
+        if not 0 <= index < len(self): raise IndexError(f"Frame {index} out of range (0-{len(self) - 1})")
+        keyframe = int(self.keyframes[np.searchsorted(self.keyframes, index, 'right') - 1])
+        start = self._position + 1 if self._position is not None and keyframe <= self._position <= index else keyframe
+        for i in range(start, index + 1): self._apply(i)
+        return self._grid.frame().copy()
+    load = frame
+
+    def frames_for_line(self, line):
+        """Indices of the frames captured while the given script line (1-based) was running."""
+        return np.flatnonzero(self.lines == line)
+
+    def close(self):
+        self.offsets = self.timestamps = self.lines = self.kinds = None  # release the views before unmapping
+        self.map.close(); self.file.close()
+
+def export_frames(recording, directory):
+    """Write every frame as a PNG plus the timestamps.txt ReplayScreen reads."""
+    from screen_backend import TIMESTAMPS_FILE, save_rgb
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, TIMESTAMPS_FILE), 'w', encoding='utf-8') as f:
+        for index in range(len(recording)):
+            name = f"frame_{index:05d}_line{recording.lines[index]}.png"
+            save_rgb(os.path.join(directory, name), recording.frame(index)); f.write(f"{name} {recording.timestamps[index]:.4f}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or export a recorded script run.")
+    parser.add_argument('path'); parser.add_argument('--export', help="write frames as PNGs with timestamps.txt into this directory")
+    parser.add_argument('--frame', type=int, help="save just this frame as frame_N.png in the current directory")
+    args = parser.parse_args(argv)
+    with RunRecording(args.path) as recording:
+        keyframes = len(recording.keyframes); duration = float(recording.timestamps[-1]) if len(recording) else 0.0
+        print(f"{args.path}: {len(recording)} frames ({keyframes} keyframes) over {duration:.2f}s, {os.path.getsize(args.path) / 1024:.0f} KiB")
+        if args.frame is not None:
+            from screen_backend import save_rgb
+            save_rgb(f"frame_{args.frame}.png", recording.frame(args.frame)); print(f"Saved frame_{args.frame}.png (line {recording.lines[args.frame]})")
+        if args.export: export_frames(recording, args.export); print(f"Exported {len(recording)} frames to {args.export}")
+
+if __name__ == '__main__':
+    main()
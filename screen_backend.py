@@ -0,0 +1,125 @@
+import bisect
+import os
+import time
+import cv2
+import numpy as np
+from image_matcher import decode_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.webm')
+RUN_EXTENSION = '.nxrun'
+TIMESTAMPS_FILE = 'timestamps.txt'  # optional "<frame file> <seconds>" per line next to recorded frame images
+DEFAULT_FPS = 30.0
+PYAUTOGUI_PAUSE = 0.1  # pyautogui sleeps this long after every call, so replay charges the same on its clock
+POINTER_ACTIONS = ('click', 'doubleClick', 'rightClick', 'moveTo', 'dragTo', 'mouseDown', 'mouseUp', 'scroll', 'hscroll')
+
+def load_rgb(path): return cv2.cvtColor(decode_image(path), cv2.COLOR_BGR2RGB)
+
+def save_rgb(path, image):
+    ok, data = cv2.imencode(os.path.splitext(path)[1] or '.png', cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_RGB2BGR))
+    if not ok: raise ValueError(f"Could not encode image '{path}'")
+    data.tofile(path)
+
+def list_frames(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+def read_timestamps(directory, paths):
+    """Seconds for each frame from the directory's timestamps file, or None when it has none."""
+    manifest = os.path.join(directory, TIMESTAMPS_FILE)
+    if not os.path.exists(manifest): return None
+    with open(manifest, 'r', encoding='utf-8') as f: stamps = dict((name, float(seconds)) for name, seconds in (line.rsplit(None, 1) for line in f if line.strip()))
+    return [stamps[os.path.basename(p)] for p in paths]
+
+def describe_action(action, args, kwargs):
+    name = action if isinstance(action, str) else getattr(action, '__name__', repr(action))
+    return f"{name}({', '.join([repr(a) for a in args] + [f'{k}={v!r}' for k, v in kwargs.items() if not k.startswith('_')])})"
+
+def pointer_target(args, kwargs):
+    if args and isinstance(args[0], (tuple, list)): return tuple(args[0][:2])
+    if 'x' in kwargs and 'y' in kwargs: return kwargs['x'], kwargs['y']
+    if len(args) >= 2 and all(isinstance(a, (int, float)) for a in args[:2]): return args[0], args[1]
+    return None
+
+def _pyautogui():
+    import pyautogui  # deferred: importing it needs a display, which replay runs do not have
+    return pyautogui
+
+class LiveScreen:
+    """The real desktop: captures with pyautogui and performs input actions, named by their pyautogui function."""
+    name = 'live'; realtime = True
+    clock = staticmethod(time.monotonic); sleep = staticmethod(time.sleep)
+    def capture(self): return np.asarray(_pyautogui().screenshot())
+    def perform(self, action, *args, **kwargs): return getattr(_pyautogui(), action)(*args, **kwargs)
+    def position(self): x, y = _pyautogui().position(); return x, y
+
+    def activate_window(self, title):
+        windows = _pyautogui().getWindowsWithTitle(title)
+        if not windows: return False
+        windows[0].activate(); return True
+
+class ImageFrames:
+    """Recorded frame images, optionally timestamped."""
+    def __init__(self, paths, timestamps=None): self.paths = list(paths); self.timestamps = timestamps
+    def __len__(self): return len(self.paths)
+    def load(self, index): return load_rgb(self.paths[index])
+
+class VideoFrames:
+    """Frames of a video file, timestamped from its frame rate and decoded on demand."""
+    def __init__(self, path):
+        self.video = cv2.VideoCapture(path)
+        if not self.video.isOpened(): raise ValueError(f"Could not open video '{path}'")
+        fps = self.video.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        self.timestamps = [i / fps for i in range(int(self.video.get(cv2.CAP_PROP_FRAME_COUNT)))]; self.position = 0
+    def __len__(self): return len(self.timestamps)
+
+    def load(self, index):
+        if index < self.position: self.video.set(cv2.CAP_PROP_POS_FRAMES, index); self.position = index
+        while self.position < index: self.video.grab(); self.position += 1  # skipped frames are not decoded
+        ok, frame = self.video.read(); self.position += 1
+        if not ok: raise ValueError(f"Could not decode video frame {index}")
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+def open_recording(path):
+    """Frames from a run recording, a video file, a directory of images (timestamped by its timestamps file, if any) or a single image."""
+    if path.lower().endswith(RUN_EXTENSION):
+        from run_recorder import RunRecording
+        return RunRecording(path)
+    if path.lower().endswith(VIDEO_EXTENSIONS): return VideoFrames(path)
+    if os.path.isdir(path): paths = list_frames(path); return ImageFrames(paths, read_timestamps(path, paths))
+    return ImageFrames([path])
+
+class ReplayScreen:
+    """A recorded frame sequence served as the screen; input is logged, never performed.
+
+    Timestamped frames are shown by a virtual clock that only waits and input pauses move forward, so a run sees the
+    same frames every time and takes only as long as its own capture/OCR/matching work. Untimed frames step forward one
+    per capture. Either way the last frame holds once the recording runs out."""
+    name = 'replay'; realtime = False
+    def __init__(self, frames, on_input=None, input_pause=PYAUTOGUI_PAUSE):
+        if isinstance(frames, (list, tuple)): frames = ImageFrames(frames)
+        if not len(frames): raise ValueError("Replay needs at least one frame")
+        self.frames = frames; self.on_input = on_input; self.input_pause = input_pause
+        self.timestamps = [float(t - frames.timestamps[0]) for t in frames.timestamps] if frames.timestamps is not None else None
+        self.now = 0.0; self.captures = 0; self.actions = []; self.pointer = (0, 0); self._current = (None, None)
+
+    def clock(self): return self.now
+    def sleep(self, seconds): self.now += max(seconds, 0.0)
+
+    def frame_index(self):
+        if self.timestamps is None: return min(self.captures, len(self.frames) - 1)
+        return max(bisect.bisect_right(self.timestamps, self.now) - 1, 0)
+
+    def capture(self):
+        index = self.frame_index(); self.captures += 1
+        if self._current[0] != index: self._current = (index, self.frames.load(index))  # only the current frame is kept in memory
+        return self._current[1]
+
+    def perform(self, action, *args, **kwargs):
+        if action in POINTER_ACTIONS: self.pointer = pointer_target(args, kwargs) or self.pointer
+        description = describe_action(action, args, kwargs); self.actions.append((self.now, description))
+        if self.on_input: self.on_input(description)
+        if action == 'write' and args: self.sleep(kwargs.get('interval', 0.0) * len(args[0]))
+        if kwargs.get('_pause', True): self.sleep(self.input_pause + kwargs.get('duration', 0.0))
+
+    def position(self): return self.pointer
+    def activate_window(self, title): self.perform('activate_window', title); return True
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Instruction kinds produced by compile_script
+OP_CALL, OP_IF, OP_ELSE, OP_LOOP, OP_ENDLOOP, OP_BREAK, OP_UNKNOWN, OP_FOREACH, OP_ENDFOREACH, OP_RETURN = range(10)
+LOOP_BLOCKS = {'loop': ('endloop', OP_LOOP, OP_ENDLOOP), 'foreach': ('endforeach', OP_FOREACH, OP_ENDFOREACH)}
+LOOP_ENDS = {end: (start, end_kind) for start, (end, _, end_kind) in LOOP_BLOCKS.items()}
+PROGRAM_CACHE_SIZE = 64
+
+class Instruction:
+    __slots__ = ('kind', 'command', 'args', 'handler', 'target', 'line_num', 'text')
+    def __init__(self, kind, command, args, line_num, text, handler=None):
+        self.kind = kind; self.command = command; self.args = args
+        self.handler = handler; self.target = None
+        self.line_num = line_num; self.text = text
+
+class CompiledProgram:
+    def __init__(self, instructions, source_hash):
+        self.instructions = instructions; self.source_hash = source_hash
+
+def script_hash(script):
+    return hashlib.sha1(script.encode('utf-8')).hexdigest()
+
+def compile_script(script, engine_cls, source_hash=None):
+    """Turn script text into a flat instruction list with jump targets and handlers resolved."""
+    ops = []; blocks = []  # blocks holds [kind, instruction_index, break_indices]
+    for line_num, raw in enumerate(script.split('\n')):
+        line = raw.strip()
+        if not line or line.startswith('#'): continue
+        parts = line.split(' ', 1); command = parts[0]; args = parts[1] if len(parts) > 1 else ""
+        index = len(ops)
+        if command.startswith('if_'):
+            ops.append(Instruction(OP_IF, command, args, line_num, line)); blocks.append(['if', index, None])
+        elif command == 'else':
+            ops.append(Instruction(OP_ELSE, command, args, line_num, line))
+            if blocks and blocks[-1][0] == 'if': ops[blocks.pop()[1]].target = index + 1
+            blocks.append(['else', index, None])
+        elif command == 'endif':
+            # endif emits nothing; the if/else it closes jumps straight to the next instruction
+            if blocks and blocks[-1][0] in ('if', 'else'): ops[blocks.pop()[1]].target = index
+        elif command in LOOP_BLOCKS:
+            ops.append(Instruction(LOOP_BLOCKS[command][1], command, args, line_num, line)); blocks.append([command, index, []])
+        elif command in LOOP_ENDS:
+            start_cmd, end_kind = LOOP_ENDS[command]
+            op = Instruction(end_kind, command, args, line_num, line); ops.append(op)
+            loop_pos = next((p for p in range(len(blocks) - 1, -1, -1) if blocks[p][0] == start_cmd), None)
+            if loop_pos is not None:
+                _, loop_index, breaks = blocks[loop_pos]; del blocks[loop_pos:]
+                op.target = loop_index + 1; ops[loop_index].target = index + 1
+                for b in breaks: ops[b].target = index + 1
+        elif command == 'return':
+            ops.append(Instruction(OP_RETURN, command, args, line_num, line))
+        elif command == 'break':
+            ops.append(Instruction(OP_BREAK, command, args, line_num, line))
+            loop_block = next((b for b in reversed(blocks) if b[0] in LOOP_BLOCKS), None)
+            if loop_block: loop_block[2].append(index)
+        else:
+            handler = getattr(engine_cls, f"handle_{command}", None)
+            kind = OP_CALL if handler else OP_UNKNOWN
+            ops.append(Instruction(kind, command, args, line_num, line, handler))
+    return CompiledProgram(ops, source_hash or script_hash(script))
+
+def check_program(program):
+    """Static problems in a compiled program as (line number, message), without running anything."""
+    problems = []; loops = {OP_LOOP, OP_FOREACH}; open_loops = 0
+    for op in program.instructions:
+        line = op.line_num + 1
+        if op.kind in loops: open_loops += 1
+        elif op.kind in (OP_ENDLOOP, OP_ENDFOREACH) and open_loops: open_loops -= 1
+        if op.kind == OP_UNKNOWN: problems.append((line, f"Unknown command '{op.command}'"))
+        elif op.kind in (OP_IF, OP_ELSE) and op.target is None: problems.append((line, f"'{op.command}' has no matching endif"))
+        elif op.kind in loops and op.target is None: problems.append((line, f"'{op.command}' has no matching {LOOP_BLOCKS[op.command][0]}"))
+        elif op.kind in (OP_ENDLOOP, OP_ENDFOREACH) and op.target is None: problems.append((line, f"'{op.command}' without a matching {LOOP_ENDS[op.command][0]}"))
+        elif op.kind == OP_BREAK and op.target is None and not open_loops: problems.append((line, "'break' outside of a loop"))
+    return problems
+
+_program_cache = OrderedDict(); _program_cache_lock = threading.Lock()
+
+def get_program(script, engine_cls):
+    """Return the compiled program for script, compiling it only on a cache miss."""
+    source_hash = script_hash(script); key = (engine_cls, source_hash)
+    with _program_cache_lock:
+        program = _program_cache.get(key)
+        if program is not None: _program_cache.move_to_end(key); return program
+    program = compile_script(script, engine_cls, source_hash)
+    with _program_cache_lock:
+        _program_cache[key] = program
+        while len(_program_cache) > PROGRAM_CACHE_SIZE: _program_cache.popitem(last=False)
+    return program
+
+_file_programs = {}  # (engine class, absolute path) -> (mtime_ns, size, program)
+
+def load_program_file(path, engine_cls):
+    """Compiled program for a script file, re-read only when its mtime or size changed. Raises OSError if it cannot be read."""
+    key = (engine_cls, os.path.abspath(path)); info = os.stat(key[1]); entry = _file_programs.get(key)
+    if entry and entry[0] == info.st_mtime_ns and entry[1] == info.st_size: return entry[2]
+    with open(key[1], 'r', encoding='utf-8') as f: program = get_program(f.read(), engine_cls)
+    _file_programs[key] = (info.st_mtime_ns, info.st_size, program)
+    return program
+
+def clear_program_cache():
+    with _program_cache_lock: _program_cache.clear()
+    _file_programs.clear()
@@ -1,4 +1,3 @@
-import pyautogui
 import pytesseract
 import cv2
 import time
@@ -6,9 +5,18 @@ import re
 import os
 import sys
 import numpy as np
-import json
-from fuzzywuzzy import fuzz
+from collections import ChainMap
 from playsound import playsound
+from expression_compiler import compile_expression
+from image_matcher import ImageMatcher, TemplateCache
+from macro_format import timed_events
+from macro_player import IDLE_GAP, MAX_INTERPOLATED_GAP, MAX_SPEED, MIN_SPEED, MacroPlayer, interpolate_moves, pyautogui_key
+from ocr_engine import MIN_TILED_AREA, OcrCache, TiledOcr, get_ocr_backend
+from text_matcher import MATCH_THRESHOLD, prepare_words, text_contains
+from profiler import ScriptProfiler
+from run_recorder import RunRecorder
+from screen_backend import LiveScreen, save_rgb
+from script_compiler import get_program, load_program_file, OP_CALL, OP_IF, OP_ELSE, OP_LOOP, OP_ENDLOOP, OP_BREAK, OP_FOREACH, OP_ENDFOREACH, OP_RETURN
 
 # Tesseract path setup
 def resource_path(relative_path):
@@ -17,133 +25,380 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 TESSERACT_DIR = 'tesseract'
 TESSERACT_EXE_PATH = resource_path(os.path.join(TESSERACT_DIR, 'tesseract.exe'))
+NUMERIC_SUFFIX = re.compile(r'^(.*?)((?:\s+-?\d+(?:\.\d+)?){1,5})\s*$')
+WAIT_POLL_MIN, WAIT_POLL_MAX, WAIT_BACKOFF = 0.05, 0.5, 1.5
+DIFF_SAMPLE_STEP = 3  # compare every 3rd pixel in each direction when checking whether the screen changed
+VARIABLE_REF = re.compile(r'^\$(\w+)$')
+PLAYBACK_ARGS = re.compile(r'^\s*"([^"]*)"\s*(.*)$')
+MACRO_MOUSE_ACTIONS = {'click_location': 'click', 'double_click_location': 'doubleClick', 'right_click_location': 'rightClick'}
+REGION_SUFFIX = re.compile(r'^(.*?)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)\s*$')
+CALL_ARGS = re.compile(r'^\s*(?:"([^"]*)"|(\S+))\s*(.*?)\s*(?:->\s*(\w+))?\s*$')
+PARAM_START = re.compile(r'\s+(?=\w+\s*=(?!=))')  # splits 'a=1 b=$x + 1' before each name=
+MAX_CALL_DEPTH = 64
+POINT_PAIR = re.compile(r'^(-?\d+),(-?\d+)$')
+
+def parse_target_and_region(args):
+    """Split '"target" [x1 y1 x2 y2]' into the unquoted target and an optional (x, y, w, h) region."""
+    match = REGION_SUFFIX.match(args.strip())
+    if not match: return args.strip().strip('"'), None
+    target, x1, y1, x2, y2 = match.group(1), *map(int, match.groups()[1:])
+    return target.strip().strip('"'), (x1, y1, x2 - x1, y2 - y1)
+
+def parse_image_args(args, default_confidence=0.8):
+    """Split '"image.png" [confidence] [x1 y1 x2 y2]' into (path, confidence, region)."""
+    match = NUMERIC_SUFFIX.match(args.strip()); numbers = match.group(2).split() if match else []
+    if len(numbers) not in (1, 4, 5): return args.strip().strip('"'), default_confidence, None
+    path = match.group(1).strip().strip('"'); confidence = default_confidence; region = None
+    if len(numbers) != 4: confidence = float(numbers.pop(0)); confidence = confidence / 100 if confidence > 1 else confidence
+    if numbers: x1, y1, x2, y2 = map(int, numbers); region = (x1, y1, x2 - x1, y2 - y1)
+    return path, confidence, region
+
+def color_match_mask(pixels, color, tolerance=0):
+    """True where every channel of an (..., 3+) RGB pixel array is within tolerance of color, in one cv2.inRange pass."""
+    color = np.asarray(color, np.int16)
+    low, high = np.clip(color - tolerance, 0, 255).astype(np.uint8), np.clip(color + tolerance, 0, 255).astype(np.uint8)
+    return cv2.inRange(np.ascontiguousarray(pixels[..., :3]).reshape(-1, 1, 3), low, high).reshape(pixels.shape[:-1]) > 0
+
+_parsed_calls = {}
+
+def parse_call(args):
+    """Split '"file" [name=expr ...] [-> var]' into (path, [(name, compiled expr)], target var), cached per argument string."""
+    parsed = _parsed_calls.get(args)
+    if parsed is None:
+        match = CALL_ARGS.match(args); quoted, bare, rest, target = match.groups()
+        if bare is not None and rest and '=' not in rest: return args.strip(), [], None  # an unquoted path with spaces
+        params = []
+        for part in PARAM_START.split(rest) if rest else []:
+            name, _, expression = part.partition('=')
+            if not expression.strip(): raise ValueError(f"Sub-script parameter '{part}' must be name=value")
+            params.append((name.strip(), compile_expression(expression)))
+        parsed = _parsed_calls[args] = (quoted if quoted is not None else bare, params, target)
+    return parsed
 
 class ScriptExitException(Exception):
     """Custom exception to signal a script exit command."""
     pass
 
+class FrameCache:
+    """Keeps the last full-screen capture as an RGB array so several screen queries in one tick share it."""
+    def __init__(self, max_age=0.05, source=None, clock=time.monotonic):
+        self.max_age = max_age; self.source = source or LiveScreen().capture; self.clock = clock; self.frame = None; self.captured_at = 0.0
+        self.on_capture = None
+        self.hits = 0; self.misses = 0
+
+    def grab(self, region=None):
+        now = self.clock()
+        if self.frame is None or now - self.captured_at > self.max_age:
+            self.frame = self._capture(); self.captured_at = now; self.misses += 1
+        else: self.hits += 1
+        if region is None: return self.frame
+        x, y, w, h = region
+        return self.frame[max(y, 0):max(y + h, 0), max(x, 0):max(x + w, 0)]  # a view, not a copy
+
+    def _capture(self):
+        frame = self.source()
+        if self.on_capture: self.on_capture(frame)
+        return frame
+
+    def invalidate(self): self.frame = None
+
+    def capture(self, region=None): self.invalidate(); return self.grab(region)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0, 'max_age': self.max_age}
+
+SHARED_TEMPLATE_CACHE = TemplateCache()
+
+_END = object()
+
 class ScriptEngine:
-    def __init__(self, update_output, update_status, popup_callback):
+    def __init__(self, update_output, update_status, popup_callback, screen=None):
         self.update_output = update_output; self.update_status = update_status
         self.popup_callback = popup_callback
         self.running = False; self.variables = {}
+        self.screen = screen or LiveScreen(); self.frame_cache = FrameCache(source=self.screen.capture, clock=self.screen.clock); self.ocr_cache = OcrCache(); self.ocr_backend = None
+        self.profiling = False; self.profile_export_path = None; self.profiler = None; self.last_playback_stats = None
+        self.record_path = None; self.run_recorder = None
+        self.call_stack = []; self.call_programs = {}; self.return_value = None
+        self.search_region = None; self.tiled_ocr = None; self.image_matcher = ImageMatcher(SHARED_TEMPLATE_CACHE)
+        self.frame_cache_age = self.frame_cache.max_age  # what frame_cache goes back to at the start of every run
         if os.path.exists(TESSERACT_EXE_PATH):
             pytesseract.pytesseract.tesseract_cmd = TESSERACT_EXE_PATH
         else: self.update_output(f"WARNING: Tesseract not found at {TESSERACT_EXE_PATH}")
 
     def _evaluate_expression(self, expression_str):
         if not expression_str.strip(): self.update_output("Error: Expression cannot be empty."); self.running = False; return None
-        def replace_var(match):
-            var_name = match.group(1)
-            if var_name in self.variables: return str(self.variables[var_name])
-            raise KeyError(f"Variable '${var_name}' not found.")
-        processed_expr = re.sub(r'\$(\w+)', replace_var, expression_str)
-        try:
-            result = eval(processed_expr, {"__builtins__": {}}, {}); return result
-        except Exception as e: self.update_output(f"Error evaluating '{processed_expr}': {e}"); self.running = False; return None
+        try: return compile_expression(expression_str)(self.variables)
+        except KeyError: raise
+        except Exception as e: self.update_output(f"Error evaluating '{expression_str.strip()}': {e}"); self.running = False; return None
+
+    def get_ocr_backend(self):
+        if self.ocr_backend is None: self.ocr_backend = get_ocr_backend(resource_path(TESSERACT_DIR))
+        return self.ocr_backend
+    def ocr_data(self, image):
+        if self.tiled_ocr and image.shape[0] * image.shape[1] >= MIN_TILED_AREA:
+            return self.ocr_cache.get_or_compute(image, 'tiled_data', lambda img, **params: self.tiled_ocr.image_to_data(img), **self.tiled_ocr.params())
+        return self.ocr_cache.get_or_compute(image, 'data', self.get_ocr_backend().image_to_data)
+    def ocr_string(self, image): return self.ocr_cache.get_or_compute(image, 'string', self.get_ocr_backend().image_to_string)
 
-    def find_image_location(self, image_path):
+    def find_image_location(self, image_path, confidence=0.8, region=None, verbose=True):
         if not self.running: return None
         try:
-            location = pyautogui.locateCenterOnScreen(image_path, confidence=0.8)
-            if not location: self.update_output(f"Image '{os.path.basename(image_path)}' not found.")
+            location = self.image_matcher.find(self.frame_cache.grab(), image_path, confidence, region)
+            if not location and verbose: self.update_output(f"Image '{os.path.basename(image_path)}' not found.")
             return location
         except Exception as e: self.update_output(f"Error locating image {image_path}: {e}"); return None
-    def find_text_location(self, text_to_find):
+    def find_text_location(self, text_to_find, region=None, verbose=True):
         if not self.running: return None
-        data = pytesseract.image_to_data(pyautogui.screenshot(), output_type=pytesseract.Output.DICT)
-        best_match = {'ratio': 0, 'location': None}
-        for i in range(len(data['text'])):
-            word = data['text'][i].strip()
-            if int(data['conf'][i]) > 50 and word:
-                ratio = fuzz.partial_ratio(text_to_find.lower(), word.lower())
-                if ratio > best_match['ratio']:
-                    x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-                    best_match.update({'ratio': ratio, 'location': (x + w / 2, y + h / 2)})
-        if best_match['ratio'] > 80: return best_match['location']
-        self.update_output(f"Text '{text_to_find}' not found."); return None
+        region = region or self.search_region
+        if region: region = (max(region[0], 0), max(region[1], 0), region[2], region[3])
+        offset_x, offset_y = region[:2] if region else (0, 0)
+        ratio, center = prepare_words(self.ocr_data(self.frame_cache.grab(region))).best(text_to_find)
+        if ratio > MATCH_THRESHOLD: return (offset_x + center[0], offset_y + center[1])
+        if verbose: self.update_output(f"Text '{text_to_find}' not found.")
+        return None
+    def find_all_text_locations(self, text_to_find, region=None):
+        region = region or self.search_region
+        if region: region = (max(region[0], 0), max(region[1], 0), region[2], region[3])
+        offset_x, offset_y = region[:2] if region else (0, 0)
+        hits = prepare_words(self.ocr_data(self.frame_cache.grab(region))).find_all(text_to_find)
+        return [(offset_x + cx, offset_y + cy) for _, _, (cx, cy) in sorted(hits)]
+    def pixel_matches(self, x, y, color, tolerance=0):
+        frame = self.frame_cache.grab()
+        if not (0 <= x < frame.shape[1] and 0 <= y < frame.shape[0]): return False  # off-screen, like color_match_fraction's misses
+        return bool(color_match_mask(frame[y, x], color, tolerance))
+    def color_match_fraction(self, pixels, color, tolerance=0):
+        """(fraction, count) of a point list or (x, y, w, h) region within tolerance of color, all from one captured frame."""
+        kind, where = pixels
+        if kind == 'region': mask = color_match_mask(self.frame_cache.grab(where), color, tolerance)
+        else:
+            frame = self.frame_cache.grab(); points = np.asarray(where, dtype=int).reshape(-1, 2); xs, ys = points[:, 0], points[:, 1]
+            inside = (xs >= 0) & (xs < frame.shape[1]) & (ys >= 0) & (ys < frame.shape[0])  # off-screen points count as misses
+            mask = np.zeros(len(points), bool); mask[inside] = color_match_mask(frame[ys[inside], xs[inside]], color, tolerance)
+        return (float(mask.mean()) if mask.size else 0.0), int(np.count_nonzero(mask))
+
+    def compile(self, script): return get_program(script, type(self))
 
     def run_script(self, script):
         self.running = True; self.update_status("Running... (F6 to stop)")
-        lines = script.split('\n'); i = 0; loop_stack = []
-        current_line_num = 0
+        self.current_instruction = None; self.call_stack.clear(); self.call_programs.clear()
+        self.search_region = None; self.tiled_ocr = None; self.frame_cache.max_age = self.frame_cache_age  # settings a script made end with its run
+        if self.profiling: self.profiler = ScriptProfiler(); self.profiler.attach(self)
+        owns_recorder = self._start_recording()
         try:
-            while i < len(lines) and self.running:
-                line = lines[i].strip()
-                current_line_num = i
-                i += 1 
-                if not line or line.startswith('#'): continue
-                
-                parts = line.split(' ', 1); command = parts[0]; args = parts[1] if len(parts) > 1 else ""
-                if command.startswith('if_'):
-                    condition_met = self.handle_if(command, args)
-                    if not condition_met: i = self.find_matching_block_end(lines, i, ('if_', 'else'), ('else', 'endif'))
-                elif command == 'else':
-                    i = self.find_matching_block_end(lines, i, ('if_', 'else'), ('endif',))
-                elif command == 'loop':
-                    if not args.strip(): self.update_output("Error: loop command requires a count."); self.running = False; continue
-                    loop_stack.append({'index': i, 'count': self._evaluate_expression(args)})
-                elif command == 'endloop':
-                    if loop_stack:
-                        loop = loop_stack[-1]; loop['count'] -= 1
-                        if loop['count'] > 0: i = loop['index']
-                        else: loop_stack.pop()
-                    else: self.update_output(f"Error: 'endloop' without 'loop' on line {current_line_num + 1}.")
-                elif command == 'break':
-                    if loop_stack: i = self.find_matching_block_end(lines, loop_stack.pop()['index'], ('loop',), ('endloop',))
-                    else: self.update_output("Error: 'break' outside of a loop.")
-                elif command == 'endif': pass
-                else:
-                    handler = getattr(self, f"handle_{command}", None)
-                    if handler:
-                        if not self.running: break
-                        handler(args)
-                    else: self.update_output(f"Unknown command: '{command}'")
-
+            self.execute_program(self.compile(script))
         except ScriptExitException:
+            self._unwind_calls()
             self.update_output("Script execution terminated by 'exit' command.")
             self.running = False
         except Exception as e:
-            self.update_output(f"ERROR on line {current_line_num + 1}: {lines[current_line_num].strip()}\n -> {e}"); self.running = False
+            op = self.current_instruction
+            location = (f"line {op.line_num + 1}: {op.text}" if op else "compile") + self._unwind_calls()
+            self.update_output(f"ERROR on {location}\n -> {e}"); self.running = False
+        if self.profiler: self._finish_profile()
+        if owns_recorder: self._finish_recording()
         
         is_finished_normally = self.running 
         status = "Finished" if is_finished_normally else "Stopped"
         self.update_status(status); self.running = False
         return is_finished_normally
 
+    def execute_program(self, program):
+        ops = program.instructions; n = len(ops); pc = 0; loop_stack = []; profiler = self.profiler
+        while pc < n and self.running:
+            op = ops[pc]; self.current_instruction = op; pc += 1
+            if profiler: profiler.step(op)
+            kind = op.kind
+            if kind == OP_CALL: op.handler(self, op.args)
+            elif kind == OP_IF:
+                if not self.handle_if(op.command, op.args): pc = op.target if op.target is not None else self._missing_block_end(op, n)
+            elif kind == OP_ELSE: pc = op.target if op.target is not None else self._missing_block_end(op, n)
+            elif kind == OP_LOOP:
+                if not op.args.strip(): self.update_output("Error: loop command requires a count."); self.running = False; continue
+                loop_stack.append(self._evaluate_expression(op.args))
+            elif kind == OP_ENDLOOP:
+                if op.target is not None and loop_stack:
+                    loop_stack[-1] -= 1
+                    if loop_stack[-1] > 0: pc = op.target
+                    else: loop_stack.pop()
+                else: self.update_output(f"Error: 'endloop' without 'loop' on line {op.line_num + 1}.")
+            elif kind == OP_FOREACH:
+                items = iter(self._foreach_items(op.args)); name = op.args.split(None, 1)[0]; item = next(items, _END)
+                if item is _END: pc = op.target if op.target is not None else self._missing_block_end(op, n); continue
+                self._assign_loop_item(name, item); loop_stack.append((name, items))
+            elif kind == OP_ENDFOREACH:
+                if op.target is not None and loop_stack:
+                    name, items = loop_stack[-1]; item = next(items, _END)
+                    if item is _END: loop_stack.pop()
+                    else: self._assign_loop_item(name, item); pc = op.target
+                else: self.update_output(f"Error: 'endforeach' without 'foreach' on line {op.line_num + 1}.")
+            elif kind == OP_RETURN: self.return_value = self._evaluate_expression(op.args) if op.args.strip() else None; return
+            elif kind == OP_BREAK:
+                if op.target is not None and loop_stack: loop_stack.pop(); pc = op.target
+                else: self.update_output("Error: 'break' outside of a loop.")
+            else: self.update_output(f"Unknown command: '{op.command}'")
+
+    def _start_recording(self):
+        """Hook the run recorder into the capture path; True when this run opened it and so has to close it."""
+        opened = False
+        if self.record_path and not self.run_recorder:
+            try: self.run_recorder = RunRecorder(self.record_path, {'screen': self.screen.name}, self.screen.clock, drop=self.screen.realtime); opened = True
+            except OSError as e: self.update_output(f"Could not start run recording: {e}")
+        if self.run_recorder:
+            recorder = self.run_recorder
+            self.frame_cache.on_capture = lambda frame: recorder.add(frame, self.current_instruction.line_num + 1 if self.current_instruction else 0)
+        return opened
+
+    def _finish_recording(self):
+        recorder = self.run_recorder; self.run_recorder = None; self.frame_cache.on_capture = None
+        try: recorder.close(); self.update_output(recorder.summary())
+        except OSError as e: self.update_output(f"Could not write run recording: {e}")
+
+    def _finish_profile(self):
+        profiler = self.profiler; self.profiler = None
+        profiler.detach(self); profiler.finish()
+        for line in profiler.report(): self.update_output(line)
+        if self.profile_export_path:
+            try:
+                profiler.export_json(self.profile_export_path + '.json'); profiler.export_csv(self.profile_export_path + '.csv')
+                self.update_output(f"Profile written to {self.profile_export_path}.json / .csv")
+            except OSError as e: self.update_output(f"Could not write profile: {e}")
+
+    def _foreach_items(self, args):
+        parts = args.split(None, 1)
+        if len(parts) < 2: raise ValueError("foreach requires a variable name and a list, e.g. foreach item $items")
+        ref = VARIABLE_REF.match(parts[1].strip())
+        value = self.variables[ref.group(1)] if ref and ref.group(1) in self.variables else self._evaluate_expression(parts[1])
+        if value is None: return []  # the expression failed and already stopped the script
+        if not isinstance(value, (list, tuple)): raise ValueError(f"foreach needs a list, but {parts[1].strip()} is {type(value).__name__} {value!r}")
+        return list(value)
+
+    def _assign_loop_item(self, name, item):
+        self.variables[name] = item
+        if isinstance(item, (tuple, list)) and len(item) == 2: self.variables[f"{name}_x"], self.variables[f"{name}_y"] = item
+
+    def _resolve_ints(self, args):
+        """Parse integer arguments, allowing $variables (including coordinate pairs) in place of literals."""
+        values = []
+        for token in args.split():
+            value = self.variables.get(token[1:]) if VARIABLE_REF.match(token) else None
+            if value is None: value = self._evaluate_expression(token) if '$' in token else token
+            values.extend(value if isinstance(value, (tuple, list)) else [value])
+        return [int(float(v)) for v in values]
+
+    def _number(self, token): return float(self._evaluate_expression(token)) if '$' in token else float(token)
+
+    def _parse_pixels(self, tokens):
+        """Split leading tokens naming pixels ($list of points, x,y pairs, or x1 y1 x2 y2) from the rest; returns ((kind, where), rest)."""
+        if tokens[0].startswith('$'):
+            value = self._evaluate_expression(tokens[0])
+            if isinstance(value, (list, tuple)) and all(isinstance(p, (list, tuple)) for p in value): return ('points', value), tokens[1:]
+        pairs = []
+        while tokens and POINT_PAIR.match(tokens[0]): pairs.append(tuple(map(int, tokens.pop(0).split(','))))
+        if pairs: return ('points', pairs), tokens
+        corners = []  # a $variable may stand for one coordinate or an x,y pair
+        while tokens and len(corners) < 4: corners += self._resolve_ints(tokens.pop(0))
+        if len(corners) != 4: raise ValueError("Expected pixels as $points, x,y pairs or a region x1 y1 x2 y2")
+        x1, y1, x2, y2 = corners; return ('region', (x1, y1, x2 - x1, y2 - y1)), tokens
+
+    def _parse_color_check(self, args):
+        """'PIXELS r g b [tolerance] ...' -> (pixels, color, tolerance, remaining tokens)."""
+        pixels, rest = self._parse_pixels(args.split())
+        if len(rest) < 3: raise ValueError("Expected a color as r g b after the points or region")
+        color = tuple(self._resolve_ints(' '.join(rest[:3]))); tolerance = int(self._number(rest[3])) if len(rest) > 3 else 0
+        return pixels, color, tolerance, rest[4:]
+
+    def _missing_block_end(self, op, end):
+        self.update_output(f"Error: Missing block end for block starting near line {op.line_num + 1}."); self.running = False; return end
+
     def stop_script(self):
         if self.running: self.running = False; self.update_output("Stop signal received...")
 
-    def perform_mouse_action(self, action_func, location, action_name):
+    def _input(self, action, *args, **kwargs):
+        """Perform an input action, named by its pyautogui function, on the screen backend; anything on screen may change, so the cached frame is dropped."""
+        result = self.screen.perform(action, *args, **kwargs); self.frame_cache.invalidate(); return result
+    def _sleep(self, seconds):
+        clock = self.screen.clock; end_time = clock() + seconds
+        while self.running and clock() < end_time: self.screen.sleep(min(0.1, max(end_time - clock(), 0)))
+
+    def perform_mouse_action(self, action, location, action_name):
         if not self.running: return
         if not location: self.update_output(f"Action '{action_name}' failed: target not found."); return
-        if action_func == pyautogui.click: action_func(location, interval=0.1)
-        else: action_func(location)
+        if action == 'click': self._input(action, location, interval=0.1)
+        else: self._input(action, location)
         self.update_output(f"Performed {action_name} at {location}")
 
-    def handle_click_location(self, args): x, y = map(int, args.split()); self.perform_mouse_action(pyautogui.click, (x, y), 'click_location')
-    def handle_click_text(self, args): self.perform_mouse_action(pyautogui.click, self.find_text_location(args.strip('"')), 'click_text')
-    def handle_click_image(self, args): self.perform_mouse_action(pyautogui.click, self.find_image_location(args.strip('"')), 'click_image')
-    def handle_double_click_location(self, args): x, y = map(int, args.split()); self.perform_mouse_action(pyautogui.doubleClick, (x, y), 'double_click_location')
-    def handle_double_click_text(self, args): self.perform_mouse_action(pyautogui.doubleClick, self.find_text_location(args.strip('"')), 'double_click_text')
-    def handle_double_click_image(self, args): self.perform_mouse_action(pyautogui.doubleClick, self.find_image_location(args.strip('"')), 'double_click_image')
-    def handle_right_click_location(self, args): x, y = map(int, args.split()); self.perform_mouse_action(pyautogui.rightClick, (x, y), 'right_click_location')
-    def handle_move_to(self, args): x, y = map(int, args.split()); pyautogui.moveTo(x, y); self.update_output(f"Moved mouse to ({x},{y})")
-    def handle_click_and_drag(self, args): x1, y1, x2, y2, duration = args.split(); pyautogui.moveTo(int(x1), int(y1)); pyautogui.dragTo(int(x2), int(y2), duration=float(duration)); self.update_output(f"Dragged from ({x1},{y1}) to ({x2},{y2})")
-    def handle_scroll(self, args): pyautogui.scroll(int(args)); self.update_output(f"Scrolled {args} units")
+    def handle_click_location(self, args): x, y = self._resolve_ints(args); self.perform_mouse_action('click', (x, y), 'click_location')
+    def handle_click_text(self, args): self.perform_mouse_action('click', self.find_text_location(*parse_target_and_region(args)), 'click_text')
+    def handle_click_image(self, args): self.perform_mouse_action('click', self.find_image_location(*parse_image_args(args)), 'click_image')
+    def handle_double_click_location(self, args): x, y = self._resolve_ints(args); self.perform_mouse_action('doubleClick', (x, y), 'double_click_location')
+    def handle_double_click_text(self, args): self.perform_mouse_action('doubleClick', self.find_text_location(*parse_target_and_region(args)), 'double_click_text')
+    def handle_double_click_image(self, args): self.perform_mouse_action('doubleClick', self.find_image_location(*parse_image_args(args)), 'double_click_image')
+    def handle_right_click_location(self, args): x, y = self._resolve_ints(args); self.perform_mouse_action('rightClick', (x, y), 'right_click_location')
+    def handle_move_to(self, args): x, y = self._resolve_ints(args); self._input('moveTo', x, y); self.update_output(f"Moved mouse to ({x},{y})")
+    def handle_click_and_drag(self, args): x1, y1, x2, y2, duration = args.split(); self._input('moveTo', int(x1), int(y1)); self._input('dragTo', int(x2), int(y2), duration=float(duration)); self.update_output(f"Dragged from ({x1},{y1}) to ({x2},{y2})")
+    def handle_scroll(self, args): self._input('scroll', int(args)); self.update_output(f"Scrolled {args} units")
     def handle_wait(self, args):
-        seconds = float(self._evaluate_expression(args)); end_time = time.time() + seconds
-        while time.time() < end_time:
-            if not self.running: break
-            time.sleep(0.1)
+        seconds = float(self._evaluate_expression(args)); self._sleep(seconds)
         if self.running: self.update_output(f"Waited for {seconds}s.")
     handle_delay = handle_wait
+
+    def wait_until(self, condition, timeout, region=None):
+        """Poll condition until it holds or timeout expires, only re-checking when the watched region changed."""
+        clock = self.screen.clock; start = clock(); deadline = start + timeout; interval = WAIT_POLL_MIN; previous = None
+        while self.running:
+            sample = self.frame_cache.capture(region)[::DIFF_SAMPLE_STEP, ::DIFF_SAMPLE_STEP]
+            if previous is None or sample.shape != previous.shape or not np.array_equal(sample, previous):
+                if condition(): return clock() - start
+                interval = WAIT_POLL_MIN  # the screen is moving; look again soon
+            else: interval = min(interval * WAIT_BACKOFF, WAIT_POLL_MAX)
+            previous = sample
+            now = clock()
+            if now >= deadline: return None
+            wake = min(now + interval, deadline)
+            while self.running and clock() < wake: self.screen.sleep(min(0.05, max(wake - clock(), 0)))
+        return None
+
+    def _report_wait(self, elapsed, timeout, description):
+        self.variables['wait_timed_out'] = elapsed is None
+        if not self.running: return
+        if elapsed is None: self.update_output(f"Timed out after {timeout}s waiting until {description}.")
+        else: self.update_output(f"Waited {elapsed:.2f}s until {description}.")
+
+    def _split_timeout(self, args):
+        timeout_str, rest = (args.strip().split(' ', 1) + [''])[:2]
+        return float(self._evaluate_expression(timeout_str)), rest
+
+    def _wait_until_image(self, args, appear):
+        timeout, rest = self._split_timeout(args); path, confidence, region = parse_image_args(rest)
+        elapsed = self.wait_until(lambda: (self.find_image_location(path, confidence, region, verbose=False) is not None) == appear, timeout, region)
+        self._report_wait(elapsed, timeout, f"image '{os.path.basename(path)}' {'appeared' if appear else 'disappeared'}")
+    def handle_wait_until_image(self, args): self._wait_until_image(args, True)
+    def handle_wait_until_not_image(self, args): self._wait_until_image(args, False)
+
+    def _wait_until_text(self, args, appear):
+        timeout, rest = self._split_timeout(args); text, region = parse_target_and_region(rest)
+        elapsed = self.wait_until(lambda: (self.find_text_location(text, region, verbose=False) is not None) == appear, timeout, region or self.search_region)
+        self._report_wait(elapsed, timeout, f"text '{text}' {'appeared' if appear else 'disappeared'}")
+    def handle_wait_until_text(self, args): self._wait_until_text(args, True)
+    def handle_wait_until_not_text(self, args): self._wait_until_text(args, False)
+
+    def _wait_until_pixel(self, args, appear):
+        timeout, rest = self._split_timeout(args); parts = rest.split()
+        x, y, r, g, b = map(int, parts[:5]); tolerance = int(parts[5]) if len(parts) > 5 else 0
+        elapsed = self.wait_until(lambda: self.pixel_matches(x, y, (r, g, b), tolerance) == appear, timeout, (x, y, 1, 1))
+        self._report_wait(elapsed, timeout, f"pixel ({x},{y}) {'matched' if appear else 'stopped matching'} ({r},{g},{b})")
+    def handle_wait_until_pixel(self, args): self._wait_until_pixel(args, True)
+    def handle_wait_until_not_pixel(self, args): self._wait_until_pixel(args, False)
     def handle_select_window(self, args):
         title = args.strip('"')
-        try: window = pyautogui.getWindowsWithTitle(title)[0]; window.activate(); self.update_output(f"Activated window: {title}")
-        except IndexError: self.update_output(f"Window '{title}' not found.")
-    def handle_key(self, args): pyautogui.press(args); self.update_output(f"Pressed key: {args}")
-    def handle_type(self, args): text = args.strip('"'); pyautogui.write(text, interval=0.05); self.update_output(f"Typed: {text}")
+        if self.screen.activate_window(title): self.frame_cache.invalidate(); self.update_output(f"Activated window: {title}")
+        else: self.update_output(f"Window '{title}' not found.")
+    def handle_key(self, args):
+        parts = args.split(); key = parts[0]; presses = int(self._evaluate_expression(parts[1])) if len(parts) > 1 else 1
+        self._input('press', key, presses=presses); self.update_output(f"Pressed key: {key}" + (f" x{presses}" if presses > 1 else ''))
+    def handle_type(self, args): text = args.strip('"'); self._input('write', text, interval=0.05); self.update_output(f"Typed: {text}")
     def handle_var(self, args):
         name, value_str = args.split(' ', 1)
         if '$' in value_str or (value_str.strip().replace('.', '', 1).isdigit()): self.variables[name] = self._evaluate_expression(value_str)
@@ -154,39 +409,66 @@ class ScriptEngine:
     def handle_get_text_region(self, args):
         parts = args.split(); var_name = parts[0]; x1, y1, x2, y2 = map(int, parts[1:])
         region = (x1, y1, x2 - x1, y2 - y1)
-        text = pytesseract.image_to_string(pyautogui.screenshot(region=region)).strip()
+        text = self.ocr_string(self.frame_cache.grab(region)).strip()
         self.variables[var_name] = text
         self.update_output(f"Got text '{text}' from region and stored in var {var_name}")
     def handle_playback(self, args):
-        path = args.strip('"')
+        match = PLAYBACK_ARGS.match(args); path, options = (match.group(1), match.group(2).split()) if match else (args.strip('"'), [])
         if not os.path.exists(path): self.update_output(f"Macro file not found: {path}"); return
-        with open(path, 'r') as f: events = json.load(f)
+        no_wait = any(o.lower() in ('nowait', 'no_wait') for o in options)
+        speeds = [float(self._evaluate_expression(o)) for o in options if o.lower() not in ('nowait', 'no_wait')]
+        speed = speeds[0] if speeds else 1.0
+        if not MIN_SPEED <= speed <= MAX_SPEED: self.update_output(f"Playback speed {speed:g}x is outside {MIN_SPEED:g}x-{MAX_SPEED:g}x; clamping.")
         self.update_output(f"--- Playing back macro: {os.path.basename(path)} ---")
-        for event in events:
-            if not self.running: break
-            cmd, e_args = event['type'], {k:v for k,v in event.items() if k != 'type'}
-            handler = getattr(self, f"handle_{cmd}", None)
-            if handler: handler(" ".join(map(str, e_args.values())))
+        player = MacroPlayer(self._play_macro_event, lambda: self.running, speed, no_wait, self.screen.clock, self.screen.sleep, self.screen.realtime)
+        events = interpolate_moves(timed_events(path), max_gap=IDLE_GAP if no_wait else MAX_INTERPOLATED_GAP)  # no-wait drops longer gaps anyway
+        self.last_playback_stats = player.play(events)  # binary macros stream from disk
+        self.update_output(self.last_playback_stats.summary())
         self.update_output(f"--- Finished macro playback ---")
+
+    def _play_macro_event(self, event):
+        # The scheduler owns the timing, so pyautogui's per-call pause and typing interval are switched off
+        kind = event['type']
+        if kind in MACRO_MOUSE_ACTIONS: x, y = int(event['x']), int(event['y']); self._input(MACRO_MOUSE_ACTIONS[kind], x, y, _pause=False); self.update_output(f"Performed {kind} at ({x}, {y})")
+        elif kind == 'mouse_move': self._input('moveTo', event['x'], event['y'], _pause=False)
+        elif kind == 'mouse_down': self._input('mouseDown', event['x'], event['y'], button=event['button'], _pause=False)
+        elif kind == 'mouse_up': self._input('mouseUp', event['x'], event['y'], button=event['button'], _pause=False)
+        elif kind == 'mouse_scroll':
+            if event['dy']: self._input('scroll', event['dy'], x=event['x'], y=event['y'], _pause=False)
+            if event['dx']: self._input('hscroll', event['dx'], x=event['x'], y=event['y'], _pause=False)
+        elif kind == 'key_down': self._input('keyDown', pyautogui_key(event['key_name']), _pause=False)
+        elif kind == 'key_up': self._input('keyUp', pyautogui_key(event['key_name']), _pause=False)
+        elif kind == 'type': self._input('write', event['text'], _pause=False)
+        elif kind == 'key': self._input('press', pyautogui_key(event['key_name']), _pause=False); self.update_output(f"Pressed key: {event['key_name']}")
+        else:
+            handler = getattr(self, f"handle_{kind}", None)
+            if handler: handler(" ".join(str(v) for k, v in event.items() if k != 'type'))
     
     def handle_script(self, args):
-        path = args.strip('"')
-        if not os.path.exists(path): self.update_output(f"Sub-script not found: {path}"); return
-        try:
-            with open(path, 'r', encoding='utf-8') as f: script_content = f.read()
-            self.update_output(f"--- Starting sub-script: {os.path.basename(path)} ---")
-            sub_engine = ScriptEngine(self.update_output, self.update_status, self.popup_callback)
-            sub_engine.variables = self.variables.copy()
-            sub_script_finished_normally = sub_engine.run_script(script_content)
-            if not sub_script_finished_normally:
-                self.running = False
-            else: # parent script inherits variables from child
-                self.variables.update(sub_engine.variables)
-            self.update_output(f"--- Finished sub-script: {os.path.basename(path)} ---")
-        except ScriptExitException:
-            # Propagate exit command to stop this script as well
-            raise ScriptExitException()
-        except Exception as e: self.update_output(f"Error in sub-script {path}: {e}")
+        """Run a script file in-process as a call: its own variable scope over the caller's, parameters in, one value back."""
+        path, params, target = parse_call(args)
+        program = self.call_programs.get(path)
+        if program is None:
+            try: program = self.call_programs[path] = load_program_file(path, type(self))  # mtime-checked once per run
+            except OSError: self.update_output(f"Sub-script not found: {path}"); return
+        if len(self.call_stack) >= MAX_CALL_DEPTH: raise RecursionError(f"Sub-script calls nested deeper than {MAX_CALL_DEPTH} (recursive call to '{path}'?)")
+        caller_vars = self.variables; caller_op = self.current_instruction
+        scope = {name: expression(caller_vars) for name, expression in params}
+        self.call_stack.append((path, caller_op, caller_vars)); self.variables = ChainMap(scope, caller_vars); self.return_value = None
+        if self.profiler: self.profiler.script = path
+        self.execute_program(program)
+        value, self.return_value = self.return_value, None  # taken here so a frame that ends without return yields None
+        self.call_stack.pop(); self.variables = caller_vars; self.current_instruction = caller_op
+        if self.profiler: self.profiler.script = self.call_stack[-1][0] if self.call_stack else None
+        if target: caller_vars[target] = value
+        elif not params: caller_vars.update(scope)  # a bare `script "file"` shares its variables back, as sub-scripts always did
+
+    def _unwind_calls(self):
+        """Leave every sub-script call after an error or exit; returns where the failing line sits in the call chain."""
+        if not self.call_stack: return ""
+        trace = " <- ".join([f"{os.path.basename(path)}" for path, _, _ in reversed(self.call_stack)] + ["main script"])
+        self.variables = self.call_stack[0][2]; self.call_stack.clear()
+        return f" (in {trace})"
 
     def handle_log(self, args): self.update_output(f"LOG: {args.strip('"')}")
 
@@ -208,11 +490,54 @@ class ScriptEngine:
             region = (x1, y1, x2 - x1, y2 - y1)
         
         try:
-            pyautogui.screenshot(path, region=region)
+            save_rgb(path, self.frame_cache.capture(region))
             self.update_output(f"Screenshot saved to {path}")
         except Exception as e:
             self.update_output(f"Failed to take screenshot: {e}")
 
+    def handle_find_all_images(self, args):
+        var_name, rest = args.strip().split(' ', 1); path, confidence, region = parse_image_args(rest)
+        try: matches = self.image_matcher.find_all(self.frame_cache.grab(), path, confidence, region)
+        except Exception as e: self.update_output(f"Error locating image {path}: {e}"); matches = []
+        self.variables[var_name] = matches
+        self.update_output(f"Found {len(matches)} match(es) of '{os.path.basename(path)}' and stored them in var {var_name}")
+
+    def handle_count_color_region(self, args):
+        var_name, rest = args.strip().split(' ', 1); pixels, color, tolerance, _ = self._parse_color_check(rest)
+        fraction, count = self.color_match_fraction(pixels, color, tolerance)
+        self.variables[var_name] = fraction; self.variables[f"{var_name}_count"] = count
+        self.update_output(f"{count} pixel(s), {fraction:.1%} of the {pixels[0]}, match {color} +/-{tolerance}; stored in var {var_name}")
+
+    def handle_find_all_text(self, args):
+        var_name, rest = args.strip().split(' ', 1); text, region = parse_target_and_region(rest)
+        matches = self.find_all_text_locations(text, region)
+        self.variables[var_name] = matches
+        self.update_output(f"Found {len(matches)} occurrence(s) of '{text}' and stored them in var {var_name}")
+
+    def handle_frame_cache(self, args):
+        arg = args.strip()
+        if arg and arg != 'stats': self.frame_cache.max_age = float(self._evaluate_expression(arg)) / 1000.0
+        stats = self.frame_cache.stats()
+        self.update_output(f"Frame cache: window {stats['max_age'] * 1000:.0f}ms, {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
+    def handle_ocr_workers(self, args):
+        self.ocr_backend = get_ocr_backend(resource_path(TESSERACT_DIR), workers=int(self._evaluate_expression(args)))
+        self.update_output(f"OCR backend: {self.ocr_backend.name} with up to {getattr(self.ocr_backend, 'workers', 1)} worker(s)")
+
+    def handle_search_region(self, args):
+        parts = args.split()
+        if not parts or parts[0] in ('off', 'full'): self.search_region = None; self.update_output("Text search region cleared (full screen)."); return
+        x1, y1, x2, y2 = map(int, parts[:4]); self.search_region = (x1, y1, x2 - x1, y2 - y1)
+        self.update_output(f"Text search region set to ({x1},{y1})-({x2},{y2})")
+
+    def handle_ocr_tiles(self, args):
+        parts = args.split()
+        if not parts or parts[0] == 'off': self.tiled_ocr = None; self.update_output("Tiled OCR disabled."); return
+        cols, rows = int(parts[0]), int(parts[1]) if len(parts) > 1 else int(parts[0])
+        workers = int(parts[2]) if len(parts) > 2 else None
+        self.tiled_ocr = TiledOcr(cols, rows, workers, resource_path(TESSERACT_DIR))
+        self.update_output(f"Tiled OCR: {cols}x{rows} tiles across {self.tiled_ocr.workers} process(es)")
+
     def handle_exit(self, args):
         raise ScriptExitException()
 
@@ -220,7 +545,7 @@ class ScriptEngine:
         parts = args.split()
         if len(parts) != 2: self.update_output("Error: mouse_pos requires two variable names."); return
         var_x, var_y = parts
-        x, y = pyautogui.position()
+        x, y = self.screen.position()
         self.variables[var_x] = x
         self.variables[var_y] = y
         self.update_output(f"Stored mouse position ({x}, {y}) in ${var_x} and ${var_y}")
@@ -231,29 +556,24 @@ class ScriptEngine:
         check_command = command.replace('if_not_', 'if_')
         result = False
         if check_command == "if_eval": result = self._evaluate_expression(args)
-        elif check_command == "if_image_screen": result = self.find_image_location(args.strip('"')) is not None
-        elif check_command == "if_text_screen": result = self.find_text_location(args.strip('"')) is not None
+        elif check_command == "if_image_screen": result = self.find_image_location(*parse_image_args(args)) is not None
+        elif check_command == "if_text_screen": result = self.find_text_location(*parse_target_and_region(args)) is not None
         elif check_command == "if_text_region":
             match = re.match(r'"([^"]+)"\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)', args)
             if not match: return False
             text, x1, y1, x2, y2 = match.groups(); region = (int(x1), int(y1), int(x2)-int(x1), int(y2)-int(y1))
-            found_text = pytesseract.image_to_string(pyautogui.screenshot(region=region))
-            is_match = fuzz.partial_ratio(text.lower(), found_text.lower()) > 80
+            found_text = self.ocr_string(self.frame_cache.grab(region))
+            is_match = text_contains(text, found_text)
             self.update_output(f"IF: Check for '{text}' in {region}. Match: {is_match}"); result = is_match
         elif check_command == "if_pixel_matches":
             parts = args.split(); x, y, r, g, b = map(int, parts[:5]); tolerance = int(parts[5]) if len(parts) > 5 else 0
-            match = pyautogui.pixelMatchesColor(x, y, (r, g, b), tolerance=tolerance)
+            match = self.pixel_matches(x, y, (r, g, b), tolerance)
             self.update_output(f"IF: Pixel at ({x},{y}) matches ({r},{g},{b}) with tolerance {tolerance}. Match: {match}"); result = match
+        elif check_command == "if_pixels_match":
+            pixels, color, tolerance, rest = self._parse_color_check(args)
+            required = self._number(rest[0]) if rest else 1.0; required = required / 100 if required > 1 else required
+            fraction, count = self.color_match_fraction(pixels, color, tolerance); self.variables['pixels_matched'] = fraction
+            result = fraction >= required
+            self.update_output(f"IF: {count} pixel(s), {fraction:.1%} of the {pixels[0]}, match {color} +/-{tolerance}, need {required:.0%}. Match: {result}")
 
         return result if should_be_true else not result
-        
-    def find_matching_block_end(self, lines, start_index, start_cmds, end_cmds):
-        level = 1; i = start_index
-        while i < len(lines):
-            line = lines[i].strip()
-            command = line.split(' ', 1)[0]
-            if any(command.startswith(s) for s in start_cmds): level += 1
-            elif command in end_cmds: level -= 1
-            if level == 0: return i + 1
-            i += 1
-        self.update_output(f"Error: Missing block end for block starting near line {start_index}."); self.running = False; return len(lines)
\ No newline at end of file
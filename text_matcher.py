@@ -0,0 +1,87 @@
+import threading
+import numpy as np
+try:
+    from rapidfuzz import fuzz, process
+    def score_all(needle, choices, scorer):
+        return process.cdist([needle], choices, scorer=scorer, dtype=np.float32)[0]
+except ImportError:  # pure-Python fallback, same scores but one call per word
+    from fuzzywuzzy import fuzz
+    def score_all(needle, choices, scorer):
+        return np.array([scorer(needle, choice) for choice in choices], dtype=np.float32)
+
+MIN_CONFIDENCE = 50
+MATCH_THRESHOLD = 80
+
+def normalize(text): return ' '.join(text.lower().split())
+
+def text_contains(needle, haystack, threshold=MATCH_THRESHOLD):
+    return fuzz.partial_ratio(normalize(needle), normalize(haystack)) > threshold
+
+class OcrWords:
+    """OCR words filtered, lowercased and grouped by line once, so every lookup on the same OCR result is a batch score."""
+    def __init__(self, data):
+        count = len(data['text'])
+        keep = [i for i in range(count) if data['text'][i].strip() and int(data['conf'][i]) > MIN_CONFIDENCE]
+        self.text = [data['text'][i].strip().lower() for i in keep]
+        self.left = np.array([data['left'][i] for i in keep], dtype=np.int32); self.top = np.array([data['top'][i] for i in keep], dtype=np.int32)
+        self.right = self.left + np.array([data['width'][i] for i in keep], dtype=np.int32)
+        self.bottom = self.top + np.array([data['height'][i] for i in keep], dtype=np.int32)
+        line_cols = [data.get(key) or [0] * count for key in ('block_num', 'par_num', 'line_num')]
+        lines = {}
+        for pos, i in enumerate(keep): lines.setdefault(tuple(col[i] for col in line_cols), []).append(pos)
+        self.lines = list(lines.values()); self._windows = {}
+
+    def center(self, first, last):
+        left, top = self.left[first:last + 1].min(), self.top[first:last + 1].min()
+        right, bottom = self.right[first:last + 1].max(), self.bottom[first:last + 1].max()
+        return (float(left + right) / 2, float(top + bottom) / 2)
+
+    def windows(self, size):
+        """Phrases of `size` adjacent words on the same line, with their (first, last) word positions."""
+        if size not in self._windows:
+            phrases, spans = [], []
+            for line in self.lines:
+                for start in range(len(line) - size + 1):
+                    phrases.append(' '.join(self.text[p] for p in line[start:start + size])); spans.append((line[start], line[start + size - 1]))
+            self._windows[size] = (phrases, spans)
+        return self._windows[size]
+
+    def _scored(self, needle):
+        words = needle.split()
+        if len(words) == 1: return score_all(needle, self.text, fuzz.partial_ratio), [(i, i) for i in range(len(self.text))]
+        # Whole-phrase ratio; partial_ratio would let any single word of the phrase score 100
+        phrases, spans = [], []
+        for size in range(max(1, len(words) - 1), len(words) + 2):
+            size_phrases, size_spans = self.windows(size); phrases += size_phrases; spans += size_spans
+        return (score_all(needle, phrases, fuzz.ratio) if phrases else np.zeros(0, dtype=np.float32)), spans
+
+    def best(self, text):
+        """Return (score, centre) of the best word or phrase match, or (0, None)."""
+        needle = normalize(text)
+        if not needle or not self.text: return 0, None
+        scores, spans = self._scored(needle)
+        if not len(scores): return 0, None
+        i = int(np.argmax(scores))
+        return float(scores[i]), self.center(*spans[i])
+
+    def find_all(self, text, threshold=MATCH_THRESHOLD):
+        """Return (top, left, centre) for every non-overlapping match above threshold."""
+        needle = normalize(text)
+        if not needle or not self.text: return []
+        scores, spans = self._scored(needle); used = set(); hits = []
+        for i in np.argsort(-scores, kind='stable'):
+            if scores[i] <= threshold: break
+            first, last = spans[i]; positions = set(range(first, last + 1))
+            if positions & used: continue
+            used |= positions; hits.append((int(self.top[first]), int(self.left[first]), self.center(first, last)))
+        return hits
+
+_prepared = {'data': None, 'words': None}; _prepared_lock = threading.Lock()
+
+def prepare_words(data):
+    # OCR results come out of OcrCache, so an unchanged screen hands back the very same dict
+    with _prepared_lock:
+        if _prepared['data'] is data: return _prepared['words']
+    words = OcrWords(data)
+    with _prepared_lock: _prepared['data'] = data; _prepared['words'] = words
+    return words
@@ -0,0 +1,108 @@
+import os
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+try:  # optional: native change notifications; without it loaded folders are polled
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+SCRIPT_EXTENSIONS = ('.txt', '.json', '.macro')
+POLL_INTERVAL = 2.0
+
+DirEntry = namedtuple('DirEntry', 'name path is_dir')
+
+def list_directory(path):
+    """Folders and script files directly under path, sorted by name; a single scandir, no per-entry stat on Windows."""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try: is_dir = entry.is_dir()
+            except OSError: continue
+            if is_dir or entry.name.endswith(SCRIPT_EXTENSIONS): entries.append(DirEntry(entry.name, os.path.join(path, entry.name), is_dir))
+    entries.sort(key=lambda e: e.name)
+    return entries
+
+def _mtime(path):
+    try: return os.stat(path).st_mtime_ns
+    except OSError: return None
+
+class WorkspaceIndex:
+    """Directory listings for the explorer, made on a worker thread and cached per folder.
+
+    Only folders that have been listed are tracked. A folder is re-listed when its mtime changes (adding, removing or
+    renaming an entry updates it), and the difference is posted to `events` as:
+        ('listing', folder, entries)          first listing of a folder, or after reset
+        ('added', folder, entry, position)
+        ('removed', folder, path)
+    The GUI drains `events` on its own thread; nothing here touches Tk."""
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.events = queue.SimpleQueue(); self.snapshots = {}; self.root = None
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='workspace-index')  # one worker, so snapshots need no lock
+        self.poll_interval = poll_interval; self._stop = threading.Event(); self._watcher = None; self._poller = None
+
+    def open(self, root):
+        self.close_watcher(); self.root = os.path.normpath(root); self._stop = threading.Event()  # fresh per poller: the old one stays set
+        self.worker.submit(self.snapshots.clear); self.request(self.root)
+        if Observer is not None:
+            try:
+                self._watcher = Observer(); self._watcher.schedule(_ChangeHandler(self), self.root, recursive=True); self._watcher.start(); return
+            except Exception: self._watcher = None  # e.g. unsupported network share; fall back to polling
+        self._poller = threading.Thread(target=self._poll_loop, args=(self._stop,), daemon=True); self._poller.start()
+
+    def request(self, folder):
+        """List a folder for display; served from the snapshot when the folder has not changed since it was last read."""
+        self.worker.submit(self._list, os.path.normpath(folder))
+
+    def rescan(self, folder):
+        """Pick up a change made by the app itself right away instead of waiting for the watcher."""
+        self.worker.submit(self._rescan, os.path.normpath(folder))
+
+    def _list(self, folder):
+        mtime = _mtime(folder); cached = self.snapshots.get(folder)
+        if cached is None or cached[0] != mtime:
+            try: cached = (mtime, list_directory(folder))
+            except OSError: cached = (mtime, [])
+            self.snapshots[folder] = cached
+        self.events.put(('listing', folder, cached[1]))
+
+    def _rescan(self, folder):
+        cached = self.snapshots.get(folder)
+        if cached is None: return  # never listed, so nothing on screen to update
+        mtime = _mtime(folder)
+        if mtime is None: self._forget(folder); return
+        if mtime == cached[0]: return
+        try: entries = list_directory(folder)
+        except OSError: return
+        self.snapshots[folder] = (mtime, entries)
+        old = {e.name: e for e in cached[1]}; new = {e.name: e for e in entries}
+        for name, entry in old.items():
+            if new.get(name) != entry: self.events.put(('removed', folder, entry.path)); self._forget(entry.path)
+        for position, entry in enumerate(entries):
+            if old.get(entry.name) != entry: self.events.put(('added', folder, entry, position))
+
+    def _forget(self, folder):
+        prefix = folder + os.sep
+        for path in [p for p in self.snapshots if p == folder or p.startswith(prefix)]: del self.snapshots[path]
+
+    def _poll_loop(self, stop):
+        while not stop.wait(self.poll_interval): self.worker.submit(self._poll)
+
+    def _poll(self):
+        for folder in list(self.snapshots): self._rescan(folder)
+
+    def close_watcher(self):
+        self._stop.set()
+        if self._watcher is not None: self._watcher.stop(); self._watcher = None
+        self._poller = None
+
+    def close(self): self.close_watcher(); self.worker.shutdown(wait=False, cancel_futures=True)
+
+if Observer is not None:
+    class _ChangeHandler(FileSystemEventHandler):
+        def __init__(self, index): self.index = index
+        def on_any_event(self, event):
+            for path in (event.src_path, getattr(event, 'dest_path', '')):
+                if path: self.index.rescan(os.path.dirname(path))